@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015 Ignacio Rossi
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library; if not, see <http://www.gnu.org/licenses/>.
+'''
+Benchmarks for ``generate_cpp_makefile``, on a synthetic C++ tree created in
+a temporary directory.
+
+The tree has ``--files`` files, half of them headers, in directories of
+``--files-per-dir`` files. Headers are arranged in ``--depth`` layers: each
+header includes ``--fan-out`` headers of the next layer, and sources include
+``--fan-out`` headers of any layer. ``--cycles`` headers also include a
+header of the previous layer, creating include cycles.
+
+Each scenario runs the generator in-process:
+
+- ``full``: no scan cache, every file is scanned.
+- ``cold_cache``: scan and fill an empty scan cache.
+- ``warm_cache``: nothing changed, every file is a cache hit.
+- ``incremental``: ``--touch`` percent of the files changed.
+- ``parallel``: like ``full``, with one scanning process per CPU.
+
+Usage (from the repository root)::
+
+    python benchmarks/makefile_generator_benchmark.py
+    python benchmarks/makefile_generator_benchmark.py --files 100000
+    python benchmarks/makefile_generator_benchmark.py \
+        --compare benchmarks/baselines/makefile_generator.json
+    python benchmarks/makefile_generator_benchmark.py \
+        --save benchmarks/baselines/makefile_generator.json
+
+Times are reported in seconds (best of ``--repeat`` runs), throughput in
+files per second.
+'''
+from __future__ import (absolute_import, unicode_literals, division,
+                        print_function)
+
+from argparse import ArgumentParser
+import collections
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'pignacio_scripts',
+                                'makefile_generator', 'src'))
+
+import generate_cpp_makefile  # noqa pylint: disable=wrong-import-position
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+CONFIG = '''\
+compiler: g++
+compiler_args: -O2
+include_dirs: [src]
+source_dir: src
+program: prog
+'''
+# Slower than baseline by more than this factor counts as a regression
+DEFAULT_THRESHOLD = 1.5
+
+
+def _get_paths(files, files_per_dir):
+    headers, sources = [], []
+    for index in range(files):
+        dirname = 'd{}'.format(index // files_per_dir)
+        if index % 2:
+            sources.append('{}/s{}.cpp'.format(dirname, index))
+        else:
+            headers.append('{}/h{}.h'.format(dirname, index))
+    return headers, sources
+
+
+def _include(path, include):
+    """ Include ``include`` from ``path``: relative to it when they are in
+    the same directory, through the include dir otherwise. """
+    if os.path.dirname(path) == os.path.dirname(include):
+        return '#include "{}"'.format(os.path.basename(include))
+    return '#include "{}"'.format(include)
+
+
+def make_tree(root, files, fan_out=5, depth=8, cycles=0, files_per_dir=100,
+              seed=0):
+    """ Create a synthetic tree (see the module docstring) under ``root``.
+    Returns the paths of the files, relative to ``root``. """
+    rand = random.Random(seed)
+    headers, sources = _get_paths(files, files_per_dir)
+    layers = [headers[i::depth] for i in range(depth)]
+    includes = collections.defaultdict(list)
+    for layer, next_layer in zip(layers, layers[1:]):
+        for header in layer:
+            includes[header] = rand.sample(next_layer,
+                                           min(fan_out, len(next_layer)))
+    # Only headers below the first layer have a previous layer to include.
+    # Including a header that includes them closes the cycle.
+    layer_of = dict((header, i) for i, layer in enumerate(layers)
+                    for header in layer)
+    candidates = [header for layer in layers[1:] for header in layer]
+    for header in rand.sample(candidates, min(cycles, len(candidates))):
+        previous_layer = layers[layer_of[header] - 1]
+        parents = [h for h in previous_layer if header in includes[h]]
+        includes[header].append(rand.choice(parents or previous_layer))
+    for source in sources:
+        includes[source] = rand.sample(headers, min(fan_out, len(headers)))
+    paths = []
+    for path in headers + sources:
+        guard = path.upper().replace('/', '_').replace('.', '_')
+        lines = ['#ifndef {}'.format(guard), '#define {}'.format(guard),
+                 '#include <vector>']
+        lines.extend(_include(path, include) for include in includes[path])
+        lines.extend(['', 'int {}(int x) {{ return x + 1; }}'.format(
+            os.path.splitext(os.path.basename(path))[0]), '#endif', ''])
+        fullpath = os.path.join(root, 'src', path)
+        if not os.path.isdir(os.path.dirname(fullpath)):
+            os.makedirs(os.path.dirname(fullpath))
+        with open(fullpath, 'w') as fout:
+            fout.write('\n'.join(lines))
+        paths.append(os.path.join('src', path))
+    with open(os.path.join(root, generate_cpp_makefile.DEFAULT_CONFIG_FILE),
+              'w') as fout:
+        fout.write(CONFIG)
+    return paths
+
+
+def _generate(args):
+    # pylint: disable=protected-access
+    options = generate_cpp_makefile._get_arg_parser().parse_args(args)
+    start = time.time()
+    generate_cpp_makefile._generate(options)
+    return time.time() - start
+
+
+def _touch(paths, percent, rand):
+    """ Change ``percent`` percent of ``paths`` (at least one). """
+    count = max(1, int(len(paths) * percent / 100))
+    for path in rand.sample(paths, count):
+        with open(path, 'a') as fout:
+            fout.write('// changed\n')
+
+
+def _clear_cache():
+    cache = os.path.join('.compiled', generate_cpp_makefile.SCAN_CACHE_FILE)
+    if os.path.exists(cache):
+        os.remove(cache)
+
+
+def run_benchmarks(paths, repeat=3, touch=1.0, seed=0):
+    """ Run every scenario in the tree in the current directory. """
+    rand = random.Random(seed)
+    scenarios = collections.OrderedDict([
+        ('full', (None, ['--no-cache'])),
+        ('cold_cache', (_clear_cache, [])),
+        ('warm_cache', (None, [])),
+        ('incremental', (lambda: _touch(paths, touch, rand), [])),
+        ('parallel', (None, ['--no-cache', '-j', '0'])),
+    ])
+    results = collections.OrderedDict()
+    for name, (prepare, args) in scenarios.items():
+        logger.info('Running %s', name)
+        times = []
+        for _ in range(repeat):
+            if prepare is not None:
+                prepare()
+            times.append(_generate(args + ['--no-timestamp']))
+        seconds = min(times)
+        results[name] = collections.OrderedDict([
+            ('seconds', round(seconds, 4)),
+            ('files_per_second', int(len(paths) / seconds)
+             if seconds else None),
+        ])
+    return results
+
+
+def _print_results(results, files):
+    print('{:<14}{:>10}{:>14}'.format('scenario', 'seconds', 'files/s'))
+    for name, values in results.items():
+        print('{:<14}{:>10.3f}{:>14}'.format(name, values['seconds'],
+                                             values['files_per_second']))
+    print('({} files)'.format(files))
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """ List the (scenario, seconds, baseline) that are slower than
+    ``threshold`` times the baseline. """
+    regressions = []
+    for name, values in results.items():
+        base = baseline.get(name, {}).get('seconds')
+        if base and values['seconds'] > base * threshold:
+            regressions.append((name, values['seconds'], base))
+    return regressions
+
+
+def _get_arg_parser():
+    parser = ArgumentParser(description='Benchmark generate_cpp_makefile')
+    parser.add_argument('--files', type=int, default=20000,
+                        help='Files in the synthetic tree (half of them '
+                        'headers). Defaults to 20000')
+    parser.add_argument('--fan-out', type=int, default=5,
+                        help='Includes per file. Defaults to 5')
+    parser.add_argument('--depth', type=int, default=8,
+                        help='Layers of headers. Defaults to 8')
+    parser.add_argument('--cycles', type=int, default=10,
+                        help='Headers that include a header of the '
+                        'previous layer. Defaults to 10')
+    parser.add_argument('--files-per-dir', type=int, default=100,
+                        help='Defaults to 100')
+    parser.add_argument('--touch', type=float, default=1.0,
+                        help='Percentage of files changed in the '
+                        'incremental scenario. Defaults to 1')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per scenario. Defaults to 3')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep', action='store_true', default=False,
+                        help="Don't delete the synthetic tree")
+    parser.add_argument('--save', help='Store results (and environment) as '
+                        'a baseline in the given JSON file')
+    parser.add_argument('--compare', help='Compare results with the '
+                        'baseline in the given JSON file')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Slowdown factor considered a regression. '
+                        'Defaults to {}'.format(DEFAULT_THRESHOLD))
+    return parser
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    options = _get_arg_parser().parse_args()
+    root = tempfile.mkdtemp(prefix='makefile_generator_benchmark')
+    cwd = os.getcwd()
+    try:
+        logger.info('Creating a %d files tree in %s', options.files, root)
+        paths = make_tree(root, options.files, options.fan_out,
+                          options.depth, options.cycles,
+                          options.files_per_dir, options.seed)
+        os.chdir(root)
+        # Only the benchmark's own progress
+        logging.getLogger().setLevel(logging.WARNING)
+        logger.setLevel(logging.INFO)
+        results = run_benchmarks(paths, options.repeat, options.touch,
+                                 options.seed)
+    finally:
+        os.chdir(cwd)
+        if options.keep:
+            logger.info('Kept the tree in %s', root)
+        else:
+            shutil.rmtree(root)
+    _print_results(results, options.files)
+    if options.save:
+        with open(options.save, 'w') as fout:
+            json.dump({
+                'python': platform.python_version(),
+                'implementation': platform.python_implementation(),
+                'machine': platform.machine(),
+                'tree': collections.OrderedDict(
+                    (name, getattr(options, name))
+                    for name in ('files', 'fan_out', 'depth', 'cycles',
+                                 'files_per_dir', 'touch', 'seed')),
+                'results': results,
+            }, fout, indent=2)
+            fout.write('\n')
+    if options.compare:
+        with open(options.compare) as fin:
+            baseline = json.load(fin)['results']
+        regressions = compare(results, baseline, options.threshold)
+        for name, seconds, base in regressions:
+            print('REGRESSION: {}: {:.3f}s (baseline: {:.3f}s)'
+                  .format(name, seconds, base))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015 Ignacio Rossi
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library; if not, see <http://www.gnu.org/licenses/>.
+'''
+Benchmarks for the record types in ``pignacio_scripts.namedtuple``, compared
+with ``collections.namedtuple``, slotted dataclasses and attrs classes (when
+available).
+
+Usage (from the repository root, with the package importable)::
+
+    python benchmarks/namedtuple_benchmark.py
+    python benchmarks/namedtuple_benchmark.py \
+        --compare benchmarks/baselines/namedtuple.json
+    python benchmarks/namedtuple_benchmark.py \
+        --save benchmarks/baselines/namedtuple.json
+
+Times are reported in nanoseconds per operation, memory in bytes per
+instance (not counting the field values).
+'''
+from __future__ import (absolute_import, unicode_literals, division,
+                        print_function)
+
+from argparse import ArgumentParser
+import collections
+import gc
+import json
+import logging
+import pickle
+import platform
+import sys
+import timeit
+
+from pignacio_scripts.namedtuple import (
+    mock_namedtuple_class, namedtuple_with_defaults, record_with_defaults)
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None  # pylint: disable=invalid-name
+
+try:
+    import dataclasses
+except ImportError:
+    dataclasses = None  # pylint: disable=invalid-name
+
+try:
+    import attr
+except ImportError:
+    attr = None  # pylint: disable=invalid-name
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+FIELD_COUNTS = (2, 10, 50)
+OPERATIONS = ('construct', 'access', 'replace', 'asdict', 'pickle')
+MEMORY_INSTANCES = 1000
+# Slower than baseline by more than this factor counts as a regression
+DEFAULT_THRESHOLD = 1.25
+
+
+def _register(cls):
+    # Generated classes must be reachable from their module for pickling
+    cls.__module__ = __name__
+    globals()[cls.__name__] = cls
+    return cls
+
+
+def _fields(count):
+    return ['f{}'.format(i) for i in range(count)]
+
+
+def _namedtuple(name, fields):
+    return _register(collections.namedtuple(name, fields))
+
+
+def _namedtuple_with_defaults(name, fields):
+    defaults = {f: 0 for f in fields[len(fields) // 2:]}
+    return _register(namedtuple_with_defaults(name, fields, defaults))
+
+
+def _mock_namedtuple(name, fields):
+    return mock_namedtuple_class(collections.namedtuple(name, fields))
+
+
+def _record_with_defaults(name, fields):
+    defaults = {f: 0 for f in fields[len(fields) // 2:]}
+    return _register(record_with_defaults(name, fields, defaults))
+
+
+def _dataclass(name, fields):
+    return _register(dataclasses.make_dataclass(name, fields, slots=True))
+
+
+def _attrs(name, fields):
+    return _register(attr.make_class(name, fields, slots=True))
+
+
+def _asdict(value):
+    return value._asdict()  # pylint: disable=protected-access
+
+
+def _replace(value, **kwargs):
+    return value._replace(**kwargs)  # pylint: disable=protected-access
+
+
+def _get_kinds():
+    kinds = collections.OrderedDict([
+        ('namedtuple', (_namedtuple, _replace, _asdict)),
+        ('namedtuple_with_defaults', (_namedtuple_with_defaults, _replace,
+                                      _asdict)),
+        ('mock_namedtuple', (_mock_namedtuple, _replace, _asdict)),
+        ('record_with_defaults', (_record_with_defaults, _replace, _asdict)),
+    ])
+    if dataclasses is not None and sys.version_info >= (3, 10):
+        kinds['dataclass_slots'] = (_dataclass, dataclasses.replace,
+                                    dataclasses.asdict)
+    if attr is not None:
+        kinds['attrs_slots'] = (_attrs, attr.evolve, attr.asdict)
+    return kinds
+
+
+def _time(func, number):
+    best = min(timeit.Timer(func).repeat(repeat=5, number=number))
+    return round(best / number * 1e9, 1)
+
+
+def _memory_per_instance(cls, kwargs):
+    if tracemalloc is None:
+        return sys.getsizeof(cls(**kwargs))
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        instances = [cls(**kwargs) for _ in range(MEMORY_INSTANCES)]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    # Don't count the list holding the instances
+    size = after - before - sys.getsizeof(instances)
+    return int(round(size / MEMORY_INSTANCES))
+
+
+def benchmark_kind(kind, factory, replace, asdict, field_count, number):
+    fields = _fields(field_count)
+    cls = factory(str('Bench_{}_{}'.format(kind, field_count)), fields)
+    kwargs = {f: i for i, f in enumerate(fields)}
+    value = cls(**kwargs)
+    first, last = fields[0], fields[-1]
+
+    def _access():
+        return getattr(value, first), getattr(value, last)
+
+    results = collections.OrderedDict()
+    results['construct'] = _time(lambda: cls(**kwargs), number)
+    results['access'] = _time(_access, number)
+    results['replace'] = _time(lambda: replace(value, **{first: -1}),
+                               number)
+    results['asdict'] = _time(lambda: asdict(value), number)
+    try:
+        pickle.dumps(value)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        results['pickle'] = None
+    else:
+        results['pickle'] = _time(
+            lambda: pickle.loads(pickle.dumps(value, 2)), number)
+    results['memory'] = _memory_per_instance(cls, kwargs)
+    return results
+
+
+def run_benchmarks(number, field_counts=FIELD_COUNTS):
+    results = collections.OrderedDict()
+    for kind, (factory, replace, asdict) in _get_kinds().items():
+        results[kind] = collections.OrderedDict()
+        for field_count in field_counts:
+            logger.info('Benchmarking %s with %d fields', kind, field_count)
+            results[kind][str(field_count)] = benchmark_kind(
+                kind, factory, replace, asdict, field_count, number)
+    return results
+
+
+def _print_results(results):
+    columns = OPERATIONS + ('memory', )
+    print('{:<26}{:>7}'.format('kind', 'fields') +
+          ''.join('{:>11}'.format(c) for c in columns))
+    for kind, by_count in results.items():
+        for field_count, values in by_count.items():
+            print('{:<26}{:>7}'.format(kind, field_count) + ''.join(
+                '{:>11}'.format('-' if values[c] is None else values[c])
+                for c in columns))
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """ List the (kind, fields, operation, value, baseline) that are slower
+    (or bigger) than ``threshold`` times the baseline. """
+    regressions = []
+    for kind, by_count in results.items():
+        for field_count, values in by_count.items():
+            base_values = baseline.get(kind, {}).get(field_count, {})
+            for name, value in values.items():
+                base = base_values.get(name)
+                if value is None or not base:
+                    continue
+                if value > base * threshold:
+                    regressions.append((kind, field_count, name, value, base))
+    return regressions
+
+
+def _get_arg_parser():
+    parser = ArgumentParser(description='Benchmark namedtuple record types')
+    parser.add_argument('-n', '--number', type=int, default=20000,
+                        help='Operations per timing run')
+    parser.add_argument('--save', help='Store results (and environment) as '
+                        'a baseline in the given JSON file')
+    parser.add_argument('--compare', help='Compare results with the '
+                        'baseline in the given JSON file')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Slowdown factor considered a regression. '
+                        'Defaults to {}'.format(DEFAULT_THRESHOLD))
+    return parser
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    options = _get_arg_parser().parse_args()
+    results = run_benchmarks(options.number)
+    _print_results(results)
+    if options.save:
+        with open(options.save, 'w') as fout:
+            json.dump({
+                'python': platform.python_version(),
+                'implementation': platform.python_implementation(),
+                'machine': platform.machine(),
+                'number': options.number,
+                'results': results,
+            }, fout, indent=2)
+            fout.write('\n')
+    if options.compare:
+        with open(options.compare) as fin:
+            baseline = json.load(fin)['results']
+        regressions = compare(results, baseline, options.threshold)
+        for kind, field_count, name, value, base in regressions:
+            print('REGRESSION: {} ({} fields) {}: {} (baseline: {})'
+                  .format(kind, field_count, name, value, base))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,83 @@
 from __future__ import unicode_literals, print_function
 from argparse import ArgumentParser, ArgumentTypeError
 import collections
+import contextlib
+import cProfile
 import datetime
+import fnmatch
+import hashlib
+import io
+import json
 import logging
+import math
+import multiprocessing
 import os
 import re
-import yaml
+import shlex
+import sys
+import time
 
-INCLUDE_RE = r'\s*#include\s+"([^"]*)"'
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None  # pylint: disable=invalid-name
+
+# Quoted includes are reported without the quotes, system includes keep
+# their angle brackets: #include "x.h" -> x.h, #include <x.h> -> <x.h>
+INCLUDE_RE = r'\s*#include\s*("[^"]*"|<[^>]*>)'
+INCLUDE_PATTERN = re.compile(INCLUDE_RE)
+# INCLUDE_RE without the leading whitespace, for a whole file read as bytes.
+# Anchoring it to the start of the line with re.MULTILINE makes the regex
+# engine try every position, so that is checked by hand instead.
+INCLUDE_BYTES_PATTERN = re.compile(
+    br'#include[^\S\n]*("[^"\n]*"|<[^>\n]*>)')
+# First line that is not blank, a preprocessor directive or (looks like) a
+# comment
+CODE_LINE_PATTERN = re.compile(br'^[^\S\n]*[^\s#/*]', re.MULTILINE)
+# A (probable) definition of main
+MAIN_PATTERN = re.compile(br'^[^\S\n]*(?:int|auto)\s+main\s*\(', re.MULTILINE)
 HEADER_EXTENSIONS = [".h", ".hpp"]
 SOURCE_EXTENSIONS = [".c", ".cpp"]
 CPP_EXTENSIONS = HEADER_EXTENSIONS + SOURCE_EXTENSIONS
 
 DEFAULT_CONFIG_FILE = '.makefilegenerator.config'
+SCAN_CACHE_FILE = '.makefilegenerator.cache'
+PCH_HEADER = 'pch.h'
+FRAGMENTS_SUBDIR = 'makefiles'
+FRAGMENT_FILE = 'rules.mk'
+FRAGMENT_ROOT_DIR = '__root__'
+FRAGMENT_PARENT_DIR = '__parent__'
+COMPILE_TIMER = 'compile_timer.py'
+COMPILE_TIMES_FILE = 'compile_times.log'
+NINJA_LOG = '.ninja_log'
+# Compile times are compared in logarithmic buckets, each this much wider
+# than the previous one, so the usual noise between builds doesn't reorder
+# the objects (and rewrite the makefile). Times under the minimum all fall in
+# the first bucket.
+COMPILE_TIME_BUCKET_RATIO = 1.5
+MIN_BUCKETED_COMPILE_TIME = 0.1
+COMPILE_COMMANDS_FILE = 'compile_commands.json'
+# Runs a compile command, and appends how long it took to the compile times
+# log if it succeeded: compile_timer.py LOG OUTPUT COMMAND...
+COMPILE_TIMER_SOURCE = """\
+# Automatically generated by generate_cpp_makefile. DO NOT EDIT BY HAND
+import subprocess
+import sys
+import time
+
+LOG, OUTPUT, COMMAND = sys.argv[1], sys.argv[2], sys.argv[3:]
+START = time.time()
+STATUS = subprocess.call(COMMAND)
+if STATUS == 0:
+    with open(LOG, 'a') as fout:
+        fout.write('{}\\t{:.3f}\\n'.format(OUTPUT, time.time() - START))
+sys.exit(STATUS)
+"""
+UNITY_SUBDIR = 'unity'
+SCAN_CACHE_VERSION = 3
+TIMESTAMP_PREFIX = '# Generated on '
+CONTENT_HASH_PREFIX = '# Content hash: '
+WRITE_BUFFER_SIZE = 1 << 16
 
 
 def _get_arg_parser():
@@ -22,35 +87,134 @@ def _get_arg_parser():
                         type=MakefileGeneratorConfig.from_argument,
                         help='Configuration file. defaults to {}'
                         .format(DEFAULT_CONFIG_FILE))
+    parser.add_argument("--no-cache", action='store_true', default=False,
+                        help="Don't use (nor update) the scan cache, and "
+                        "rescan every file")
+    parser.add_argument("--cache-hash", action='store_true', default=False,
+                        help='Check the contents hash of files whose mtime '
+                        'or size changed before rescanning them')
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help='Number of processes used for scanning files. '
+                        '0 uses one per CPU. Defaults to 1')
+    parser.add_argument("--stop-at-code", action='store_true', default=False,
+                        help='Only look for includes before the first line '
+                        'of code of each file (heuristic: misses includes '
+                        'after declarations or inside #if blocks with '
+                        'code)')
+    parser.add_argument("--check-scanner", action='store_true',
+                        default=False,
+                        help='Compare the include scanner with the '
+                        'line-by-line reference scanner on every file, '
+                        'report the differences and exit')
+    parser.add_argument("--analyze", action='store_true', default=False,
+                        help='Instead of generating a makefile, report the '
+                        'headers whose changes rebuild the most objects, '
+                        'and the headers and sources nothing uses')
+    parser.add_argument("--affected", nargs='+', metavar='FILE',
+                        help='Instead of generating a makefile, print the '
+                        'objects that must be rebuilt when FILEs change. '
+                        "'-' reads the files from stdin, one per line (as "
+                        "in git diff --name-only)")
+    parser.add_argument("--top", type=int, default=20,
+                        help='Number of headers listed by --analyze. '
+                        'Defaults to 20')
+    parser.add_argument("--closure", action='store_true', default=False,
+                        help='List every header an object depends on '
+                        '(directly or not) as its prerequisite, instead of '
+                        'only its direct includes')
+    parser.add_argument("--watch", action='store_true', default=False,
+                        help='Keep running, and update the makefile when '
+                        'source files change. Uses inotify (pyinotify) when '
+                        'available, polling otherwise')
+    parser.add_argument("--poll", action='store_true', default=False,
+                        help='Always poll for changes in --watch mode')
+    parser.add_argument("--poll-interval", type=float, default=1.0,
+                        help='Seconds between polls (or of quiet after a '
+                        'change, with inotify) in --watch mode. Defaults to '
+                        '1')
+    parser.add_argument("--backend", choices=sorted(BACKENDS),
+                        default='make',
+                        help='Build system to generate files for. Defaults '
+                        'to make')
+    parser.add_argument("--no-timestamp", action='store_true', default=False,
+                        help="Don't write the generation timestamp, so the "
+                        "makefile only depends on its inputs")
+    parser.add_argument("--split", action='store_true', default=False,
+                        help='Write the rules of the files in each '
+                        'directory to their own makefile fragment, which '
+                        'the makefile includes. Only the fragments that '
+                        'change are rewritten. For large trees')
+    parser.add_argument("--record-times", action='store_true',
+                        default=False,
+                        help='List objects longest compile first, using the '
+                        'compile times recorded so far, so make -j (or '
+                        'ninja) starts them first. The makefile wraps '
+                        'compiles with a script that records how long each '
+                        'object takes to compile. With --backend ninja, the '
+                        'times are read from the .ninja_log instead')
+    parser.add_argument("--compile-commands", action='store_true',
+                        default=False,
+                        help='Also write a {} for clangd, clang-tidy and '
+                        'other tools'.format(COMPILE_COMMANDS_FILE))
+    parser.add_argument("--stats", action='store_true', default=False,
+                        help='Report scan counters (files, bytes, includes, '
+                        'cache hits) and how long each phase took')
+    parser.add_argument("--profile", metavar='FILE',
+                        help='Profile the run with cProfile and dump the '
+                        'results to FILE, to be read with pstats')
     return parser
 
 
+STRING_TYPES = (str, type(''))
+# Configuration fields: name -> (description, types, default). Fields with a
+# ``None`` default are required.
+CONFIG_FIELDS = collections.OrderedDict([
+    ('compiler', ("Compiler", STRING_TYPES, None)),
+    ('compiler_args', (None, STRING_TYPES, "")),
+    ('compiler_launcher', (None, STRING_TYPES, "")),
+    ('source_dir', ("Sources dir", STRING_TYPES, None)),
+    ('include_dirs', (None, (list,), [])),
+    ('libs', (None, (list,), [])),
+    ('program', (None, STRING_TYPES, "")),
+    ('targets', (None, (list,), [])),
+    ('compiled_subdir', (None, STRING_TYPES, ".compiled")),
+    ('pch_headers', (None, (int,), 0)),
+    ('unity_batch_size', (None, (int,), 0)),
+    ('unity_exclude', (None, (list,), [])),
+])
+
+
 class MakefileGeneratorConfig():
     def __init__(self, config):
-        self._config = config
-        self.libs = self._get_field("libs", default=[])
-        self.compiler = self._get_field("compiler", description="Compiler")
-        self.cargs = self._get_field("compiler_args", default="")
-        self.source_dir = os.path.normpath(
-            self._get_field("source_dir",
-                            description="Sources dir"))
-        self.program = self._get_field("program", description="Program name")
-        self.compiled_subdir = self._get_field("compiled_subdir",
-                                               default=".compiled")
-
-    def _get_field(self, name, default=None, description=None):
-        try:
-            return self._config[name]
-        except KeyError:
-            if default is not None:
-                return default
-            if description is None:
-                message = ("Field '{}' is missing from configuration file"
-                           .format(name))
-            else:
-                message = ("{} field '{}' is missing from configuration file"
-                           .format(description, name))
-            raise ValueError(message)
+        self._config = _validate_config(config)
+        self.libs = self._config['libs']
+        self.compiler = self._config['compiler']
+        self.cargs = self._config['compiler_args']
+        self.source_dir = os.path.normpath(self._config['source_dir'])
+        self.targets = self._get_targets()
+        self.extra_include_dirs = [os.path.normpath(d)
+                                   for d in self._config['include_dirs']]
+        # Same order as the compiler: compiler_args first, then include_dirs
+        self.include_dirs = (_get_include_dirs(self.cargs) +
+                             self.extra_include_dirs)
+        self.compiled_subdir = os.path.normpath(
+            self._config['compiled_subdir'])
+        self.pch_headers = self._config['pch_headers']
+        self.unity_batch_size = self._config['unity_batch_size']
+        self.unity_exclude = self._config['unity_exclude']
+        self.compiler_launcher = self._config['compiler_launcher']
+
+    def _get_targets(self):
+        """ The ``targets`` of the config, or a program named ``program``
+        built from every source file if there are none. The config must
+        have been validated with ``_validate_config``. """
+        if not self._config['targets']:
+            return [BuildTarget(self._config['program'], 'program', ['*'],
+                                [], [])]
+        return [BuildTarget(target['name'], target.get('type', 'program'),
+                            target.get('sources', ['*']),
+                            target.get('libs', []), target.get('link', []))
+                for target in self._config['targets']]
 
     @classmethod
     def from_file(cls, filename):
@@ -58,10 +222,9 @@ class MakefileGeneratorConfig():
             raise ValueError("{}: Could not load config from '{}'. "
                              "File does not exist"
                              .format(cls.__name__, filename))
-        with open(filename) as fin:
-            config = yaml.load(fin) or {}
+        config = _load_config_file(filename)
         if not isinstance(config, dict):
-            raise ValueError("{}: Coudl not load config from '{}'. "
+            raise ValueError("{}: Could not load config from '{}'. "
                              "Parsed config is not a dictionary"
                              .format(cls.__name__, filename))
         return cls(config)
@@ -74,14 +237,203 @@ class MakefileGeneratorConfig():
             raise ArgumentTypeError(str(exception))
 
 
-def _get_dependencies(fname):
-    with open(fname) as fin:
+def _validate_config(config):
+    """ Check every field of ``config`` against ``CONFIG_FIELDS`` at once,
+    and return it with the defaults of the missing optional fields. All the
+    problems found are reported in a single ``ValueError``. """
+    errors = []
+    validated = {}
+    for name, value in config.items():
+        if name not in CONFIG_FIELDS:
+            logging.warning("Ignoring unknown configuration field '%s'", name)
+            continue
+        _description, types, _default = CONFIG_FIELDS[name]
+        if not isinstance(value, types) or isinstance(value, bool):
+            errors.append("Field '{}' should be a {}, not {!r}".format(
+                name, types[0].__name__, value))
+        validated[name] = value
+    for name, (description, _types, default) in CONFIG_FIELDS.items():
+        if name in validated:
+            continue
+        if default is not None:
+            validated[name] = default
+        elif description is None:
+            errors.append("Field '{}' is missing from configuration file"
+                          .format(name))
+        else:
+            errors.append("{} field '{}' is missing from configuration file"
+                          .format(description, name))
+    targets = validated['targets']
+    if targets and isinstance(targets, list):
+        errors.extend(_get_target_errors(targets))
+    elif not targets and not validated['program']:
+        errors.append("Program name field 'program' is missing from "
+                      "configuration file")
+    if errors:
+        raise ValueError(". ".join(errors))
+    return validated
+
+
+# List of strings fields of each target: name -> default
+TARGET_LIST_FIELDS = collections.OrderedDict([
+    ('sources', ['*']),
+    ('libs', []),
+    ('link', []),
+])
+
+
+def _get_target_errors(targets):
+    """ The problems of the ``targets`` config field, as
+    ``_validate_config`` reports them. """
+    errors = []
+    kinds = {}
+    for target in targets:
+        if (not isinstance(target, dict) or
+                not isinstance(target.get('name'), STRING_TYPES)):
+            errors.append("Targets must be dictionaries with a 'name' "
+                          "field. Got: {!r}".format(target))
+            continue
+        name = target['name']
+        if name in kinds:
+            errors.append("Target '{}' is defined more than once"
+                          .format(name))
+        kinds[name] = target.get('type', 'program')
+        if kinds[name] not in TARGET_TYPES:
+            errors.append("Target '{}' has an invalid type '{}'. Valid "
+                          "types: {}".format(name, kinds[name],
+                                             ", ".join(sorted(TARGET_TYPES))))
+        for field, default in TARGET_LIST_FIELDS.items():
+            value = target.get(field, default)
+            if (not isinstance(value, list) or
+                    not all(isinstance(v, STRING_TYPES) for v in value)):
+                errors.append("Target '{}' field '{}' should be a list of "
+                              "strings, not {!r}".format(name, field, value))
+    for target in targets:
+        if not isinstance(target, dict) or target.get('name') not in kinds:
+            continue
+        link = target.get('link', [])
+        for library in link if isinstance(link, list) else []:
+            if (isinstance(library, STRING_TYPES) and
+                    kinds.get(library, 'program') == 'program'):
+                errors.append("Target '{}' links with '{}', which is not a "
+                              "library target".format(target['name'],
+                                                      library))
+    return errors
+
+
+def _load_config_file(filename):
+    """ Parse the YAML config in ``filename``. """
+    with open(filename) as fin:
+        return _parse_yaml(fin) or {}
+
+
+def _parse_yaml(fin):
+    # Imported here, as yaml takes a while to import and only the config
+    # needs it
+    import yaml  # pylint: disable=import-outside-toplevel
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    return yaml.load(fin, Loader=loader)
+
+
+# A program or library built from the objects of the source files that match
+# the ``sources`` globs (relative to source_dir). ``link`` lists the library
+# targets it is linked with.
+BuildTarget = collections.namedtuple('BuildTarget',
+                                     ['name', 'kind', 'sources', 'libs',
+                                      'link'])
+
+TARGET_TYPES = {
+    'program': ('', ''),
+    'static_library': ('lib', '.a'),
+    'shared_library': ('lib', '.so'),
+}
+
+
+def _get_target(targets, name):
+    return next(t for t in targets if t.name == name)
+
+
+def _get_target_filename(target):
+    """ ``foo`` -> ``foo``, ``libfoo.a`` or ``libfoo.so``, depending on the
+    type of the target. """
+    prefix, extension = TARGET_TYPES[target.kind]
+    dirname, basename = os.path.split(target.name)
+    return os.path.join(dirname, prefix + basename + extension)
+
+
+def _get_include_dirs(cargs):
+    """ Directories given with ``-I`` in the compiler arguments, in order.
+    """
+    include_dirs = []
+    args = iter(shlex.split(cargs))
+    for arg in args:
+        if arg == '-I':
+            arg += next(args, '')
+        if arg.startswith('-I') and len(arg) > 2:
+            include_dirs.append(os.path.normpath(arg[2:]))
+    return include_dirs
+
+
+def _get_includes(fname, stop_at_code=False):
+    return _scan_file(fname, stop_at_code)[0]
+
+
+def _scan_file(fname, stop_at_code=False):
+    """ Like ``_get_includes``, but returns ``(includes, bytes_read)``. """
+    with open(fname, 'rb') as fin:
+        data = fin.read()
+    bytes_read = len(data)
+    if data.find(b'#include') == -1:
+        return [], bytes_read
+    if stop_at_code:
+        mobj = CODE_LINE_PATTERN.search(data)
+        if mobj:
+            data = data[:mobj.start()]
+    includes = []
+    for mobj in INCLUDE_BYTES_PATTERN.finditer(data):
+        start = mobj.start()
+        line_start = data.rfind(b'\n', 0, start) + 1
+        if not data[line_start:start].strip():
+            includes.append(
+                _strip_quotes(mobj.group(1).decode('utf-8', 'replace')))
+    return includes, bytes_read
+
+
+def _strip_quotes(include):
+    return include[1:-1] if include.startswith('"') else include
+
+
+def _get_includes_by_line(fname):
+    """ Reference (slow) include scanner, used to validate
+    ``_get_includes``. """
+    with io.open(fname, encoding='utf-8', errors='replace') as fin:
         for line in fin:
-            mobj = re.match(INCLUDE_RE, line)
+            mobj = INCLUDE_PATTERN.match(line)
             if mobj:
-                dep = _normalize_dependency(fname, mobj.group(1))
-                if os.path.isfile(dep):
-                    yield dep
+                yield _strip_quotes(mobj.group(1))
+
+
+def _check_scanner(source_dir, stop_at_code=False):
+    differences = 0
+    for path in sorted(_list_source_dir(source_dir)):
+        expected = list(_get_includes_by_line(path))
+        found = _get_includes(path, stop_at_code)
+        if found != expected:
+            differences += 1
+            logging.warning("%s: expected %s, got %s", path, expected, found)
+    logging.info("Scanner check: %d files differ", differences)
+    return differences
+
+
+def _get_dependencies(fname, includes=None, file_index=None):
+    if includes is None:
+        includes = _get_includes(fname)
+    if file_index is None:
+        file_index = FileIndex.from_filesystem()
+    for include in includes:
+        dep = file_index.resolve(fname, include)
+        if dep is not None:
+            yield dep
 
 
 def _normalize_dependency(parent, dependency):
@@ -92,108 +444,1648 @@ def _rm_extension(fname):
     return fname.rsplit(".", 1)[0]
 
 
-def _get_header_file(cppfile):
+def _get_header_file(cppfile, file_index=None):
+    if file_index is None:
+        file_index = FileIndex.from_filesystem()
     basename = _rm_extension(cppfile)
     for extensions in HEADER_EXTENSIONS:
         fname = basename + extensions
-        if os.path.isfile(fname):
+        if file_index.isfile(fname):
             return fname
     return None
 
 
+class FileIndex(object):
+    """ The files found while walking the source and include directories.
+
+    Include resolution only does dictionary and set lookups, instead of one
+    ``isfile`` call (a ``stat`` syscall) per candidate path.
+
+    Includes searched in the include dirs are looked up by basename, and the
+    candidates are ranked by the position of the include dir they are in, so
+    the first include dir wins, as with the compiler. Results are memoized
+    per include.
+
+    Paths are stored normalized (``./a/b.h`` -> ``a/b.h``), as the paths
+    includes resolve to are.
+    """
+
+    def __init__(self, files, include_dirs=()):
+        self.files = files
+        self.include_dirs = []
+        self._dir_rank = {}
+        for include_dir in include_dirs:
+            include_dir = os.path.normpath(include_dir)
+            if include_dir not in self._dir_rank:
+                self._dir_rank[include_dir] = len(self.include_dirs)
+                self.include_dirs.append(include_dir)
+        self._by_basename = None
+        self._search_results = {}
+
+    @classmethod
+    def from_dirs(cls, dirs, include_dirs=()):
+        files = set()
+        for root in dirs:
+            for path, _subdirs, fnames in os.walk(root):
+                files.update(os.path.normpath(os.path.join(path, f))
+                             for f in fnames)
+        return cls(files, include_dirs)
+
+    @classmethod
+    def from_filesystem(cls, include_dirs=()):
+        """ An index that checks the filesystem on every lookup, for
+        resolving includes outside of a walk. """
+        return cls(_FilesystemSet(), include_dirs)
+
+    def isfile(self, path):
+        return path in self.files
+
+    def add(self, path):
+        path = os.path.normpath(path)
+        if path not in self.files:
+            self.files.add(path)
+            self._reset()
+
+    def discard(self, path):
+        path = os.path.normpath(path)
+        if path in self.files:
+            self.files.discard(path)
+            self._reset()
+
+    def _reset(self):
+        self._by_basename = None
+        self._search_results = {}
+
+    def resolve(self, parent, include):
+        """ Path of the file ``include``d from ``parent``, or ``None`` if it
+        can't be found.
+
+        ``"quoted"`` includes are looked up relative to the including file
+        first, then in the include dirs. ``<system>`` includes are only
+        looked up in the include dirs.
+        """
+        if include.startswith('<'):
+            return self.search(include[1:-1])
+        dep = _normalize_dependency(parent, include)
+        if dep in self.files:
+            return dep
+        return self.search(include)
+
+    def search(self, include):
+        """ Path of ``include`` in the first include dir that has it. """
+        try:
+            return self._search_results[include]
+        except KeyError:
+            pass
+        if isinstance(self.files, _FilesystemSet):
+            result = self._probe(include)
+        else:
+            result = self._lookup(include)
+        self._search_results[include] = result
+        return result
+
+    def _probe(self, include):
+        for include_dir in self.include_dirs:
+            dep = os.path.normpath(os.path.join(include_dir, include))
+            if dep in self.files:
+                return dep
+        return None
+
+    def _lookup(self, include):
+        include = os.path.normpath(include)
+        if os.path.isabs(include) or include.startswith(os.pardir):
+            return self._probe(include)
+        if self._by_basename is None:
+            self._by_basename = collections.defaultdict(list)
+            for path in self.files:
+                self._by_basename[os.path.basename(path)].append(path)
+        best, best_rank = None, len(self.include_dirs)
+        suffix = os.sep + include
+        for candidate in self._by_basename.get(os.path.basename(include),
+                                               ()):
+            if candidate == include:
+                prefix = os.curdir
+            elif candidate.endswith(suffix):
+                prefix = candidate[:-len(suffix)] or os.sep
+            else:
+                continue
+            rank = self._dir_rank.get(prefix, best_rank)
+            if rank < best_rank:
+                best, best_rank = candidate, rank
+        return best
+
+
+class _FilesystemSet(object):
+    # pylint: disable=too-few-public-methods
+    def __contains__(self, path):
+        return os.path.isfile(path)
+
+
+class ScanCache(object):
+    """ Persistent cache of the includes found in each scanned file.
+
+    Entries are keyed by path and are valid while the file's mtime and size
+    don't change. With ``use_hash``, a file whose mtime or size changed is
+    hashed, and only rescanned if its contents changed too.
+
+    Only the raw include names are cached: resolving them against the files
+    that currently exist is done on every run, so adding or deleting a file
+    is always taken into account.
+    """
+
+    def __init__(self, filename, entries=None, use_hash=False,
+                 scan_mode=None):
+        self.filename = filename
+        self.use_hash = use_hash
+        self.scan_mode = scan_mode
+        self._entries = entries or {}
+        self._seen = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, filename, use_hash=False, scan_mode=None):
+        entries = None
+        try:
+            with open(filename) as fin:
+                data = json.load(fin)
+            if (data.get('version') == SCAN_CACHE_VERSION and
+                    data.get('scan_mode') == scan_mode):
+                entries = data['entries']
+            else:
+                logging.info("Ignoring scan cache '%s' from another version "
+                             "or scan mode", filename)
+        except IOError:
+            pass
+        except (ValueError, KeyError, AttributeError):
+            logging.warning("Ignoring corrupt scan cache '%s'", filename)
+        return cls(filename, entries, use_hash=use_hash, scan_mode=scan_mode)
+
+    def lookup(self, path):
+        """ Return the cached includes for ``path``, or ``None`` if there is
+        no valid entry and the file must be scanned (and then ``store``d).
+        """
+        stat = os.stat(path)
+        mtime = getattr(stat, 'st_mtime_ns', stat.st_mtime)
+        entry = self._entries.get(path)
+        digest = None
+        if entry is not None and (entry['mtime'] != mtime or
+                                  entry['size'] != stat.st_size):
+            if self.use_hash and entry.get('hash') is not None:
+                digest = _hash_file(path)
+                if digest != entry['hash']:
+                    entry = None
+            else:
+                entry = None
+        if entry is None:
+            self.misses += 1
+            if self.use_hash and digest is None:
+                digest = _hash_file(path)
+            self._seen[path] = {'mtime': mtime, 'size': stat.st_size,
+                                'hash': digest}
+            return None
+        self.hits += 1
+        entry.update(mtime=mtime, size=stat.st_size)
+        if digest is not None:
+            entry['hash'] = digest
+        self._seen[path] = entry
+        return entry['includes']
+
+    def store(self, path, includes):
+        """ Cache the ``includes`` scanned from ``path``, after a failed
+        ``lookup``. """
+        self._seen[path]['includes'] = includes
+
+    def forget(self, path):
+        """ Drop the entry of a deleted file. """
+        self._seen.pop(path, None)
+        self._entries.pop(path, None)
+
+    def save(self):
+        """ Store the entries used in this run. Entries for files that were
+        not scanned (deleted, for example) are dropped. """
+        dirname = os.path.dirname(self.filename)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w') as fout:
+            json.dump({'version': SCAN_CACHE_VERSION,
+                       'scan_mode': self.scan_mode,
+                       'entries': self._seen}, fout)
+        _replace_file(tmp_filename, self.filename)
+
+
+def _hash_file(fname):
+    with open(fname, 'rb') as fin:
+        return hashlib.sha1(fin.read()).hexdigest()
+
+
+def _replace_file(src, dst):
+    try:
+        os.replace(src, dst)
+    except AttributeError:  # Python 2
+        os.rename(src, dst)
+
+
+def _get_scan_mode(stop_at_code):
+    return 'stop_at_code' if stop_at_code else 'full'
+
+
+def _get_scan_cache_filename(config):
+    return os.path.join(config.compiled_subdir, SCAN_CACHE_FILE)
+
+
 def main():
     logging.basicConfig(level=logging.INFO)
-    options = _get_arg_parser().parse_args()
-    with open("makefile", "w") as fout:
-        _print_makefile(options.config, fout)
+    parser = _get_arg_parser()
+    options = parser.parse_args()
+    if options.split and options.backend != 'make':
+        parser.error("--split only works with the make backend")
+    if options.check_scanner:
+        sys.exit(1 if _check_scanner(options.config.source_dir,
+                                     options.stop_at_code) else 0)
+    if options.profile is None:
+        _generate(options)
+        return
+    profile = cProfile.Profile()
+    try:
+        profile.runcall(_generate, options)
+    finally:
+        profile.dump_stats(options.profile)
+        logging.info("Profile written to '%s'", options.profile)
+
+
+def _generate(options):
+    config = options.config
+    stats = GeneratorStats()
+    cache = None
+    if not options.no_cache:
+        with stats.phase('cache load'):
+            cache = ScanCache.load(
+                _get_scan_cache_filename(config),
+                use_hash=options.cache_hash,
+                scan_mode=_get_scan_mode(options.stop_at_code))
+    tree = SourceTree(config.source_dir, config.include_dirs,
+                      options.stop_at_code, stats=stats)
+    tree.scan(cache, options.jobs)
+    dependencies = tree.dependencies
+    if cache is not None:
+        logging.info("Scan cache: %d hits, %d misses", cache.hits,
+                     cache.misses)
+        stats.count('cache hits', cache.hits)
+        stats.count('cache misses', cache.misses)
+        with stats.phase('cache save'):
+            cache.save()
+    if options.analyze:
+        _print_analysis(sys.stdout, tree, options.top)
+        return
+    if options.affected:
+        graph = DependencyGraph(dependencies, config)
+        for object_fname in graph.affected_objects(
+                _read_paths(options.affected)):
+            print(object_fname)
+        return
+    if options.watch:
+        if options.stats:
+            logging.info("Initial scan stats:")
+            stats.log()
+        try:
+            _watch(options, cache, tree)
+        except KeyboardInterrupt:
+            logging.info("Stopped watching")
+        return
+    filename, _print_function = BACKENDS[options.backend]
+    if not _update_build_files(options, dependencies, stats):
+        logging.info("%s is up to date", filename)
+    if options.stats:
+        logging.info("Stats:")
+        stats.log()
+
+
+class PollingWatcher(object):
+    """ Detects changes in the files under ``roots`` by comparing their
+    mtime and size every ``interval`` seconds. """
+
+    def __init__(self, roots, interval):
+        self.roots = roots
+        self.interval = interval
+        self._snapshot = self._take_snapshot()
+
+    def _take_snapshot(self):
+        snapshot = {}
+        for root in self.roots:
+            for path, _subdirs, fnames in os.walk(root):
+                for fname in fnames:
+                    fullpath = os.path.join(path, fname)
+                    try:
+                        stat = os.stat(fullpath)
+                    except OSError:
+                        continue
+                    snapshot[fullpath] = (stat.st_mtime, stat.st_size)
+        return snapshot
+
+    def wait(self):
+        """ Block until some files change, and return their paths. """
+        while True:
+            time.sleep(self.interval)
+            snapshot = self._take_snapshot()
+            changed = set(
+                path for path in set(snapshot) | set(self._snapshot)
+                if snapshot.get(path) != self._snapshot.get(path))
+            self._snapshot = snapshot
+            if changed:
+                return changed
+
+
+class InotifyWatcher(object):
+    """ Detects changes in the files under ``roots`` with inotify. Changes
+    are batched until ``interval`` seconds pass without new events. """
+    # pylint: disable=no-member
+    FILE_MASK = (pyinotify.IN_CREATE | pyinotify.IN_DELETE |
+                 pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_FROM |
+                 pyinotify.IN_MOVED_TO) if pyinotify else 0
+    NEW_DIR_MASK = (pyinotify.IN_CREATE |
+                    pyinotify.IN_MOVED_TO) if pyinotify else 0
+
+    def __init__(self, roots, interval):
+        self._changed = set()
+        # inotify reports absolute paths, the source tree may use relative
+        # ones
+        self._relative = not any(os.path.isabs(r) for r in roots)
+        self._manager = pyinotify.WatchManager()
+        for root in roots:
+            self._manager.add_watch(root, self.FILE_MASK, rec=True,
+                                    auto_add=True)
+        self._notifier = pyinotify.Notifier(self._manager, self._on_event,
+                                            timeout=int(interval * 1000))
+
+    def _on_event(self, event):
+        path = os.path.normpath(event.pathname)
+        if self._relative:
+            path = os.path.relpath(path)
+        self._changed.add(path)
+        if event.dir and event.mask & self.NEW_DIR_MASK:
+            # Files created before the new directory was watched don't get
+            # their own events
+            for subpath, _subdirs, fnames in os.walk(path):
+                self._changed.update(os.path.join(subpath, f)
+                                     for f in fnames)
+
+    def wait(self):
+        """ Block until some files change, and return their paths. """
+        while True:
+            if self._notifier.check_events():
+                self._notifier.read_events()
+                self._notifier.process_events()
+            elif self._changed:
+                changed, self._changed = self._changed, set()
+                return changed
+
+
+def _get_watcher(roots, options):
+    if pyinotify is not None and not options.poll:
+        return InotifyWatcher(roots, options.poll_interval)
+    logging.info("Polling for changes every %s seconds",
+                 options.poll_interval)
+    return PollingWatcher(roots, options.poll_interval)
+
+
+def _render(options, plan, dependencies):
+    """ The chunks of the makefile (or build.ninja) of ``plan``. """
+    _filename, chunks_function = BACKENDS[options.backend]
+    return chunks_function(options.config, plan, dependencies,
+                           not options.no_timestamp)
+
+
+def _update_build_files(options, dependencies, stats=None):
+    """ Write the makefile (or build.ninja) and the sources generated for
+    it, if they changed. Returns whether the makefile was written. """
+    if stats is None:
+        stats = GeneratorStats()
+    filename, _chunks_function = BACKENDS[options.backend]
+    with stats.phase('plan'):
+        compile_times = (_load_compile_times(options.config,
+                                             options.backend)
+                         if options.record_times else None)
+        plan = _get_build_plan(options.config, dependencies,
+                               options.closure, compile_times,
+                               options.record_times and
+                               options.backend == 'make')
+    # Rendering is streamed into the output files, so it is timed with the
+    # writes
+    with stats.phase('render and write'):
+        _write_generated_files(options.config, plan)
+        if options.compile_commands:
+            _write_file_if_changed(
+                COMPILE_COMMANDS_FILE,
+                _get_compile_commands(options.config, plan))
+        if options.split:
+            return _write_split_makefile(options, plan, dependencies)
+        return _write_if_changed(filename,
+                                 _render(options, plan, dependencies))
+
+
+def _hash_content(filename):
+    """ The content hash of ``filename``, computed as ``_write_if_changed``
+    does: without the timestamp line and the content hash at the end.
+    ``None`` if it can't be read.
+
+    The whole file is hashed, instead of trusting the hash written at its
+    end, so a file that was edited by hand is regenerated. """
+    timestamp = TIMESTAMP_PREFIX.encode('utf-8')
+    digest = hashlib.sha1()
+    last_line = None
+    try:
+        with open(filename, 'rb', WRITE_BUFFER_SIZE) as fin:
+            for line in fin:
+                if last_line is not None:
+                    digest.update(last_line)
+                last_line = None if line.startswith(timestamp) else line
+    except IOError:
+        return None
+    if (last_line is not None and
+            not last_line.startswith(CONTENT_HASH_PREFIX.encode('utf-8'))):
+        digest.update(last_line)
+    return digest.hexdigest()
+
+
+def _write_if_changed(filename, chunks):
+    """ Write the makefile (or build.ninja) rendered as ``chunks`` to
+    ``filename``, followed by its content hash.
+
+    The chunks are streamed into a temporary file and hashed on the way,
+    without the timestamp (which is always a chunk of its own), so the
+    whole content is never in memory. If the hash matches the one of the
+    existing file's content, the temporary file is dropped, and a file
+    whose content didn't change keeps its mtime. Otherwise it is renamed
+    over ``filename``. Returns whether the file was written.
+    """
+    dirname = os.path.dirname(filename)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    digest = hashlib.sha1()
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'wb', WRITE_BUFFER_SIZE) as fout:
+        for chunk in chunks:
+            data = chunk.encode('utf-8')
+            fout.write(data)
+            if not chunk.startswith(TIMESTAMP_PREFIX):
+                digest.update(data)
+        digest = digest.hexdigest()
+        fout.write('{}{}\n'.format(CONTENT_HASH_PREFIX,
+                                    digest).encode('utf-8'))
+    if _hash_content(filename) == digest:
+        os.remove(tmp_filename)
+        return False
+    _replace_file(tmp_filename, filename)
+    return True
+
+
+def _write_generated_files(config, plan):
+    """ Write the precompiled and unity build sources of ``plan`` whose
+    content changed, and delete the unity sources it no longer uses. """
+    for filename, content in sorted(plan.generated.items()):
+        _write_file_if_changed(filename, content)
+    unity_dir = os.path.join(config.compiled_subdir, UNITY_SUBDIR)
+    if os.path.isdir(unity_dir):
+        for fname in os.listdir(unity_dir):
+            path = os.path.join(unity_dir, fname)
+            if (_has_extension(path, SOURCE_EXTENSIONS) and
+                    path not in plan.generated):
+                os.remove(path)
+
+
+def _write_file_if_changed(filename, content):
+    """ Write ``content`` to ``filename``, unless it already has it. Returns
+    whether the file was written. """
+    try:
+        with io.open(filename, encoding='utf-8') as fin:
+            if fin.read() == content:
+                return False
+    except IOError:
+        pass
+    dirname = os.path.dirname(filename)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    with io.open(filename, 'w', encoding='utf-8') as fout:
+        fout.write(content)
+    return True
+
+
+def _get_compile_commands(config, plan):
+    """ The compilation database of ``plan``: how each source file is
+    compiled. The sources in a unity source get the command of the unity
+    source, but with themselves as input, which is what tools that parse
+    single files expect. The compiler launcher is left out. """
+    directory = os.path.abspath(os.curdir)
+    common = (shlex.split(config.compiler) + shlex.split(config.cargs))
+    includes = ["-I{}".format(d) for d in config.extra_include_dirs]
+    commands = []
+    for path, object_fname, _deps in sorted(plan.objects):
+        arguments = (common + _get_compile_flags(plan, object_fname) +
+                     includes + ["-c", "-o", object_fname])
+        for source in plan.batches.get(path, [path]):
+            commands.append(collections.OrderedDict([
+                ('directory', directory),
+                ('file', source),
+                ('output', object_fname),
+                ('arguments', arguments + [source]),
+            ]))
+    commands.sort(key=lambda command: command['file'])
+    return json.dumps(commands, indent=2) + "\n"
+
+
+def _load_compile_times(config, backend):
+    """ Map each object to the seconds its last recorded compile took.
+
+    Times are read from the log written by the compile timer of the
+    makefile, or from ninja's own log with the ninja backend. Missing or
+    unreadable logs give no times.
+    """
+    times = {}
+    if backend == 'ninja':
+        # ninja log (v5 and later): start end mtime output hash, in ms
+        filename = os.path.join(config.compiled_subdir, NINJA_LOG)
+        if not os.path.isfile(filename):
+            filename = NINJA_LOG
+        for fields in _read_log(filename, 5):
+            try:
+                times[fields[3]] = (int(fields[1]) - int(fields[0])) / 1000.
+            except ValueError:
+                continue
+    else:
+        filename = os.path.join(config.compiled_subdir, COMPILE_TIMES_FILE)
+        for fields in _read_log(filename, 2):
+            try:
+                times[fields[0]] = float(fields[1])
+            except ValueError:
+                continue
+    return times
+
+
+def _read_log(filename, num_fields):
+    """ The tab separated lines of ``filename`` with ``num_fields`` fields.
+    """
+    try:
+        with io.open(filename, encoding='utf-8', errors='replace') as fin:
+            for line in fin:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) == num_fields and not line.startswith('#'):
+                    yield fields
+    except IOError:
+        return
+
+
+def _watch(options, cache, tree):
+    config = options.config
+    watcher = _get_watcher(tree.roots, options)
+    compiled_subdir = os.path.normpath(config.compiled_subdir)
+    logging.info("Watching %s for changes", ", ".join(tree.roots))
+    while True:
+        filename, _print_function = BACKENDS[options.backend]
+        if _update_build_files(options, tree.dependencies):
+            logging.info("%s updated", filename)
+        if cache is not None:
+            cache.save()
+        while True:
+            changed = [path for path in watcher.wait()
+                       if not _is_subpath(os.path.normpath(path),
+                                          compiled_subdir)]
+            if changed and tree.update(changed, cache):
+                break
 
 
 def _has_extension(fname, extensions):
     return any(fname.endswith(e) for e in extensions)
 
 
-def _walk_source_dir(source_dir):
-    dependencies = collections.defaultdict(list)
+def _list_source_dir(source_dir):
     for path, _subdirs, files in os.walk(source_dir):
         for fname in files:
             fullpath = os.path.join(path, fname)
-            if not _has_extension(fullpath, CPP_EXTENSIONS):
-                continue
-            dependencies[fullpath].extend(_get_dependencies(fullpath))
-    return dependencies
+            if _has_extension(fullpath, CPP_EXTENSIONS):
+                yield fullpath
+
+
+def _scan_chunk(args):
+    paths, stop_at_code = args
+    return [(path,) + _scan_file(path, stop_at_code) for path in paths]
+
+
+def _scan_files(paths, jobs=1, stop_at_code=False):
+    """ Find the includes of each file in ``paths``, using ``jobs``
+    processes. Returns a list of ``(path, includes, bytes_read)`` in the
+    same order as ``paths``. """
+    if jobs <= 0:
+        jobs = multiprocessing.cpu_count()
+    if jobs == 1 or len(paths) < 2:
+        return _scan_chunk((paths, stop_at_code))
+    # A few chunks per process, so a slow chunk doesn't stall the others
+    chunk_size = max(1, -(-len(paths) // (jobs * 4)))
+    chunks = [(paths[i:i + chunk_size], stop_at_code)
+              for i in range(0, len(paths), chunk_size)]
+    pool = multiprocessing.Pool(jobs)
+    try:
+        results = pool.map(_scan_chunk, chunks)
+    finally:
+        pool.close()
+        pool.join()
+    return [result for chunk in results for result in chunk]
+
+
+def _is_subpath(path, root):
+    """ Whether ``path`` is ``root`` or is in it. Both must be normalized.
+    """
+    if root == os.curdir:
+        return not (os.path.isabs(path) or path == os.pardir or
+                    path.startswith(os.path.join(os.pardir, '')))
+    return path == root or path.startswith(os.path.join(root, ''))
+
+
+class SourceTree(object):
+    """ The include graph of the C/C++ files in ``source_dir`` (and of the
+    headers in ``include_dirs``).
+
+    ``scan`` builds it from scratch, and ``update`` refreshes only the
+    files that changed. Paths are normalized, as in ``FileIndex``.
+    """
+
+    def __init__(self, source_dir, include_dirs=(), stop_at_code=False,
+                 stats=None):
+        self.source_dir = os.path.normpath(source_dir)
+        self.include_dirs = [os.path.normpath(d) for d in include_dirs]
+        self.stop_at_code = stop_at_code
+        self.extra_dirs = [d for d in self.include_dirs
+                           if not _is_subpath(d, self.source_dir)]
+        self.file_index = None
+        self.includes = {}
+        self.dependencies = collections.defaultdict(list)
+        self.stats = stats if stats is not None else GeneratorStats()
+
+    @property
+    def roots(self):
+        return [self.source_dir] + self.extra_dirs
+
+    def is_scanned(self, path):
+        """ Whether ``path`` is part of the graph. """
+        if _is_subpath(path, self.source_dir):
+            return _has_extension(path, CPP_EXTENSIONS)
+        return _has_extension(path, HEADER_EXTENSIONS)
+
+    def scan(self, cache=None, jobs=1):
+        stats = self.stats
+        with stats.phase('walk'):
+            self.file_index = FileIndex.from_dirs(self.roots,
+                                                  self.include_dirs)
+        stats.count('files found', len(self.file_index.files))
+        self.includes = {}
+        with stats.phase('cache lookup'):
+            for path in self.file_index.files:
+                if self.is_scanned(path):
+                    self.includes[path] = (None if cache is None
+                                           else cache.lookup(path))
+        to_scan = sorted(p for p, incs in self.includes.items()
+                         if incs is None)
+        with stats.phase('scan'):
+            for path, includes, size in _scan_files(to_scan, jobs,
+                                                    self.stop_at_code):
+                self.includes[path] = includes
+                stats.count('files scanned')
+                stats.count('bytes read', size)
+                if cache is not None:
+                    cache.store(path, includes)
+        with stats.phase('resolve'):
+            self._resolve(self.includes)
+
+    def update(self, changed_paths, cache=None):
+        """ Refresh the graph after ``changed_paths`` were created, modified
+        or deleted.
+
+        Changed files are rescanned. If files were added or deleted, every
+        file's includes are resolved again (a memory only operation), as
+        includes that failed (or succeeded) before may now resolve
+        differently. Returns whether the graph changed.
+        """
+        files_changed = False
+        to_scan = []
+        for path in changed_paths:
+            path = os.path.normpath(path)
+            if os.path.isfile(path):
+                files_changed |= not self.file_index.isfile(path)
+                self.file_index.add(path)
+                if self.is_scanned(path):
+                    to_scan.append(path)
+            elif not os.path.exists(path):
+                # A deleted file, or a deleted (or moved) directory. New
+                # directories are skipped: their files are reported too
+                for removed in [p for p in self.file_index.files
+                                if _is_subpath(p, path)]:
+                    files_changed = True
+                    self.file_index.discard(removed)
+                    self.includes.pop(removed, None)
+                    self.dependencies.pop(removed, None)
+                    if cache is not None:
+                        cache.forget(removed)
+        changed = {}
+        for path in sorted(to_scan):
+            includes = (None if cache is None else cache.lookup(path))
+            if includes is None:
+                includes, size = _scan_file(path, self.stop_at_code)
+                self.stats.count('files scanned')
+                self.stats.count('bytes read', size)
+                if cache is not None:
+                    cache.store(path, includes)
+            if includes != self.includes.get(path):
+                changed[path] = includes
+            self.includes[path] = includes
+        if files_changed:
+            self.dependencies = collections.defaultdict(list)
+            self._resolve(self.includes)
+        else:
+            self._resolve(changed)
+        return files_changed or bool(changed)
+
+    def _resolve(self, includes):
+        for path, path_includes in sorted(includes.items()):
+            dependencies = list(_get_dependencies(path, path_includes,
+                                                  self.file_index))
+            self.dependencies[path] = dependencies
+            self.stats.count('includes found', len(path_includes))
+            self.stats.count('unresolved includes',
+                             len(path_includes) - len(dependencies))
+
+
+class GeneratorStats(object):
+    """ Counters and per-phase timings of a run, reported with --stats. """
+
+    def __init__(self):
+        self.counters = collections.OrderedDict()
+        self.timings = collections.OrderedDict()
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """ Add the time spent in the ``with`` block to phase ``name``. """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[name] = (self.timings.get(name, 0) +
+                                  time.time() - start)
+
+    def log(self):
+        width = max([len(n) for n in list(self.counters) +
+                     list(self.timings)] or [0])
+        for name, value in self.counters.items():
+            logging.info("  %-*s %12d", width, name, value)
+        total = sum(self.timings.values())
+        for name, seconds in self.timings.items():
+            logging.info("  %-*s %10.3fs %5.1f%%", width, name, seconds,
+                         100. * seconds / total if total else 0)
+        logging.info("  %-*s %10.3fs", width, 'total', total)
+
+
+class DependencyGraph(object):
+    """ Queries on the include graph of a source tree.
+
+    ``dependencies`` maps each file to the files it includes, as found by
+    ``SourceTree``. ``from_config`` builds it from the persisted scan
+    cache, so only files that changed since the last run are read. The
+    reverse (included by) edges are indexed once, so the queries only visit
+    the files in their answer.
+
+    Paths are relative to the directory the generator runs in, as in the
+    makefile.
+    """
+
+    def __init__(self, dependencies, config=None):
+        self.dependencies = dependencies
+        self.config = config
+        self._reverse = collections.defaultdict(set)
+        for path, deps in dependencies.items():
+            for dep in deps:
+                self._reverse[dep].add(path)
+        self._objects = None
+        self._pch_deps = set()
+
+    @classmethod
+    def from_config(cls, config, use_cache=True, jobs=1, stop_at_code=False):
+        """ Scan the tree of ``config`` (using and updating its scan cache,
+        unless ``use_cache`` is false) and return its graph. """
+        cache = None
+        if use_cache:
+            cache = ScanCache.load(_get_scan_cache_filename(config),
+                                   scan_mode=_get_scan_mode(stop_at_code))
+        tree = SourceTree(config.source_dir, config.include_dirs,
+                          stop_at_code)
+        tree.scan(cache, jobs)
+        if cache is not None:
+            cache.save()
+        return cls(tree.dependencies, config)
+
+    def includes_of(self, path, transitive=False):
+        """ The files ``path`` includes, directly or, with ``transitive``,
+        through other files. """
+        path = os.path.normpath(path)
+        if not transitive:
+            return sorted(self.dependencies.get(path, ()))
+        return sorted(self._reach(path, self.dependencies) - set([path]))
+
+    def reverse_deps(self, header, transitive=True):
+        """ The files that include ``header``, directly or (by default)
+        through other files. """
+        header = os.path.normpath(header)
+        if not transitive:
+            return sorted(self._reverse.get(header, ()))
+        return sorted(self._reach(header, self._reverse) - set([header]))
+
+    def affected_sources(self, changed_files):
+        """ The source files to recompile when ``changed_files`` change: the
+        changed sources, and the sources that include a changed file. """
+        affected = set()
+        for path in changed_files:
+            affected |= self._reach(os.path.normpath(path), self._reverse)
+        return sorted(p for p in affected
+                      if _has_extension(p, SOURCE_EXTENSIONS) and
+                      p in self.dependencies)
+
+    def affected_objects(self, changed_files):
+        """ The object files to rebuild when ``changed_files`` change, as
+        named in the makefile (unity build objects included). Needs the
+        ``config``. """
+        if self.config is None:
+            raise ValueError("affected_objects needs the generator config")
+        if self._objects is None:
+            plan = _get_build_plan(self.config, self.dependencies)
+            self._objects = {}
+            for path, object_fname, _deps in plan.objects:
+                for source in plan.batches.get(path, [path]):
+                    self._objects[source] = object_fname
+            self._pch_deps = set(plan.pch_deps)
+        changed_files = [os.path.normpath(p) for p in changed_files]
+        if any(p in self._pch_deps for p in changed_files):
+            # Every object depends on the precompiled header
+            return sorted(set(self._objects.values()))
+        return sorted(set(self._objects[p]
+                          for p in self.affected_sources(changed_files)
+                          if p in self._objects))
+
+    @staticmethod
+    def _reach(start, edges):
+        """ ``start`` and every node reachable from it through ``edges``.
+        """
+        reached = set([start])
+        pending = [start]
+        while pending:
+            for node in edges.get(pending.pop(), ()):
+                if node not in reached:
+                    reached.add(node)
+                    pending.append(node)
+        return reached
+
+
+def _read_paths(paths):
+    """ ``paths``, with ``-`` replaced by the paths in stdin. """
+    result = []
+    for path in paths:
+        if path == '-':
+            result.extend(line.strip() for line in sys.stdin
+                          if line.strip())
+        else:
+            result.append(path)
+    return result
+
+
+def _walk_source_dir(source_dir, cache=None, jobs=1, stop_at_code=False,
+                     include_dirs=()):
+    """ Map each C/C++ file in ``source_dir`` (and each header in
+    ``include_dirs``) to the files it includes. """
+    tree = SourceTree(source_dir, include_dirs, stop_at_code)
+    tree.scan(cache, jobs)
+    return tree.dependencies
+
+
+def _strongly_connected_components(graph):
+    """ Tarjan's algorithm, without recursion so deep include chains don't
+    hit the recursion limit. Visits each node and edge once.
+
+    Returns the components in reverse topological order: every component
+    comes after the components it depends on.
+    """
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+    for root in sorted(graph):
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph.get(root, ())))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(graph.get(child, ()))))
+                    break
+                elif child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+def _transitive_closure(graph):
+    """ Map each node of ``graph`` to the set of nodes it reaches.
+
+    Nodes in the same strongly connected component (an include cycle) reach
+    the same nodes, so their closure is computed once and shared. Apart from
+    building the resulting sets, this is O(V + E).
+    """
+    closures = {}
+    component_reach = []
+    component_of = {}
+    for component_id, component in enumerate(
+            _strongly_connected_components(graph)):
+        for member in component:
+            component_of[member] = component_id
+        reach = set()
+        cyclic = len(component) > 1
+        for member in component:
+            for child in graph.get(member, ()):
+                child_component = component_of[child]
+                if child_component == component_id:
+                    cyclic = True
+                else:
+                    reach.update(component_reach[child_component])
+        if cyclic:
+            reach.update(component)
+        for member in component:
+            closures[member] = reach
+        component_reach.append(reach | set(component))
+    return closures
+
+
+def _relative_to(path, root):
+    """ ``os.path.relpath(path, root)``, without its (slow) path
+    normalization for the usual case of a normalized ``path`` in ``root``.
+    """
+    if (root != os.curdir and not root.endswith(os.sep) and
+            path.startswith(root + os.sep)):
+        return path[len(root) + 1:]
+    return os.path.relpath(path, root)
 
 
 def _get_object_filename(source_path, config):
-    object_fname = os.path.relpath(source_path, config.source_dir)
+    object_fname = _relative_to(source_path, config.source_dir)
     object_fname = os.path.join(config.compiled_subdir, object_fname)
     return _rm_extension(object_fname) + ".o"
 
 
-def _print_makefile(config, fout):
+def _get_rebuild_fan_out(dependencies):
+    """ Map each header to the sources that include it, directly or not:
+    the objects that are rebuilt when it changes. """
+    closures = _transitive_closure(dependencies)
+    fan_out = dict((path, set()) for path in dependencies
+                   if _has_extension(path, HEADER_EXTENSIONS))
+    for path in dependencies:
+        if _has_extension(path, SOURCE_EXTENSIONS):
+            for dep in closures[path]:
+                if dep in fan_out:
+                    fan_out[dep].add(path)
+    return fan_out
+
+
+def _get_unreachable_sources(tree, closures):
+    """ The sources that can't be linked into a program: the ones that no
+    source defining ``main`` uses, directly or through other sources.
+
+    The include graph doesn't tell which symbols are used, so a source is
+    assumed to be used by every source that includes its header (the
+    header with the same name, as for the makefile rules).
+    """
+    sources = [p for p in tree.dependencies
+               if _has_extension(p, SOURCE_EXTENSIONS)]
+    users = collections.defaultdict(list)
+    for source in sources:
+        header = _get_header_file(source, tree.file_index)
+        if header is not None:
+            users[header].append(source)
+    reachable = set()
+    pending = [p for p in sources if _defines_main(p)]
+    while pending:
+        source = pending.pop()
+        if source in reachable:
+            continue
+        reachable.add(source)
+        for dep in closures[source]:
+            pending.extend(users.get(dep, ()))
+    if not reachable:
+        return None
+    return sorted(set(sources) - reachable)
+
+
+def _defines_main(fname):
+    with open(fname, 'rb') as fin:
+        return MAIN_PATTERN.search(fin.read()) is not None
+
+
+def _print_analysis(fout, tree, top=20):
     def _print(message=""):
         print(message, file=fout)
 
-    dependencies = _walk_source_dir(config.source_dir)
-    _print("# Automatically generated makefile. DO NOT EDIT BY HAND")
-    _print("# Generated on {}".format(datetime.datetime.now()))
-    _print()
-    _print("CC := {}".format(config.compiler))
-    _print("CARGS := {}".format(config.cargs))
-    _print("LIBS := {}".format(" ".join("-l{}".format(l)
-                                        for l in config.libs)))
+    dependencies = tree.dependencies
+    fan_out = _get_rebuild_fan_out(dependencies)
+    sources = sum(1 for p in dependencies
+                  if _has_extension(p, SOURCE_EXTENSIONS))
+    _print("# Rebuild fan-out: objects rebuilt when a header changes "
+           "(of {})".format(sources))
+    ranked = sorted(fan_out.items(), key=lambda item: (-len(item[1]),
+                                                       item[0]))
+    for header, users in ranked[:top]:
+        _print("{:8d} {:5.1f}% {}".format(
+            len(users), 100. * len(users) / sources if sources else 0,
+            header))
     _print()
-    _print("all: {}".format(config.program))
-    _print()
-
-    dependencies = sorted(dependencies.items())
 
-    _print()
-    _print("# Source files")
+    unused = [header for header, users in ranked if not users]
+    _print("# Headers no source includes, directly or not ({})"
+           .format(len(unused)))
+    for header in sorted(unused):
+        _print(header)
     _print()
 
-    object_fnames = []
+    unreachable = _get_unreachable_sources(tree,
+                                           _transitive_closure(dependencies))
+    if unreachable is None:
+        _print("# No source defines main, skipped the unused sources check")
+    else:
+        _print("# Sources not used from any source defining main ({})"
+               .format(len(unreachable)))
+        for source in unreachable:
+            _print(source)
 
-    for path, deps in dependencies:
+
+def _get_objects(config, dependencies, closure=False):
+    """ List the ``(source, object, dependencies)`` of each source file, in
+    source order. Dependencies are the direct includes of the source, or
+    all the files it depends on, with ``closure``. """
+    closures = _transitive_closure(dependencies) if closure else None
+    objects = []
+    for path, deps in sorted(dependencies.items()):
         if not _has_extension(path, SOURCE_EXTENSIONS):
             continue
-        object_fname = _get_object_filename(path, config)
-        object_fnames.append(object_fname)
-        _print("{}: {} {}".format(object_fname, path, " ".join(deps)))
-        _print("\t-@mkdir -p {}".format(os.path.dirname(object_fname)))
-        _print("\t$(CC) $(CARGS) -c -MMD -MP -MF\"$(@:%.o=%.d)\" "
-               "-MT\"$(@:%.o=%.d)\" -o \"$@\" \"$<\" $(LIBS)")
-        _print()
+        if closures is not None:
+            deps = sorted(closures[path] - set([path]))
+        objects.append((path, _get_object_filename(path, config), deps))
+    return objects
 
-    _print()
-    _print("# Header files")
-    _print()
 
-    for path, deps in dependencies:
-        if not _has_extension(path, HEADER_EXTENSIONS):
+def _get_target_objects(config, objects):
+    """ Map each target name to the object files it is built from, in
+    ``objects`` order. Every object is compiled once, even if several
+    targets use it. Returns that and the set of objects that must be
+    compiled with ``-fPIC``, as they are used by shared libraries. """
+    target_objects = collections.OrderedDict()
+    pic_objects = set()
+    for target in config.targets:
+        target_objects[target.name] = [
+            object_fname for path, object_fname, _deps in objects
+            if _matches_any(_relative_to(path, config.source_dir),
+                            target.sources)]
+        if not target_objects[target.name]:
+            logging.warning("Target '%s' has no source files", target.name)
+        if target.kind == 'shared_library':
+            pic_objects.update(target_objects[target.name])
+    return target_objects, pic_objects
+
+
+# What the backends build: the ``(source, object, dependencies)`` of every
+# object that is compiled, the objects of each target, the objects compiled
+# with -fPIC, the precompiled header (``None`` or its path) and the files it
+# depends on, the sources the generator writes (path -> content) and the
+# command that compiles are wrapped with to record their times (or None),
+# and the sources batched in each unity source. Objects are listed longest
+# compile first.
+BuildPlan = collections.namedtuple('BuildPlan',
+                                   ['objects', 'target_objects',
+                                    'pic_objects', 'pch', 'pch_deps',
+                                    'generated', 'compile_timer',
+                                    'batches'])
+
+
+def _get_build_plan(config, dependencies, closure=False, compile_times=None,
+                    record_times=False):
+    objects = _get_objects(config, dependencies, closure)
+    target_objects, pic_objects = _get_target_objects(config, objects)
+    used_objects = set(o for objs in target_objects.values() for o in objs)
+    objects = [o for o in objects if o[1] in used_objects]
+    generated = {}
+    batches = {}
+    pch, pch_deps = None, []
+    if config.pch_headers > 0:
+        pch, pch_deps = _get_precompiled_header(config, dependencies,
+                                                objects, generated)
+    if config.unity_batch_size > 1:
+        objects, target_objects, pic_objects = _get_unity_objects(
+            config, objects, target_objects, pic_objects, generated,
+            batches)
+    objects, target_objects = _order_by_compile_time(
+        objects, target_objects, compile_times or {})
+    compile_timer = None
+    if record_times:
+        timer = os.path.join(config.compiled_subdir, COMPILE_TIMER)
+        generated[timer] = COMPILE_TIMER_SOURCE
+        compile_timer = "{} {} {}".format(
+            sys.executable, timer,
+            os.path.join(config.compiled_subdir, COMPILE_TIMES_FILE))
+    return BuildPlan(objects, target_objects, pic_objects, pch, pch_deps,
+                     generated, compile_timer, batches)
+
+
+def _order_by_compile_time(objects, target_objects, compile_times):
+    """ Sort ``objects`` and the objects of each target by decreasing
+    compile time, so the slowest compiles start first with ``make -j``
+    instead of being left for the end. Objects without a recorded time are
+    assumed to take the average time. Times are compared by
+    ``_get_compile_time_bucket``, and ties are sorted by name. """
+    known = [compile_times[o] for _path, o, _deps in objects
+             if o in compile_times]
+    default = sum(known) / len(known) if known else 0
+
+    def _key(object_fname):
+        return (-_get_compile_time_bucket(compile_times.get(object_fname,
+                                                            default)),
+                object_fname)
+
+    objects = sorted(objects, key=lambda obj: _key(obj[1]))
+    target_objects = collections.OrderedDict(
+        (name, sorted(objs, key=_key))
+        for name, objs in target_objects.items())
+    return objects, target_objects
+
+
+def _get_compile_time_bucket(seconds):
+    if seconds < MIN_BUCKETED_COMPILE_TIME:
+        return 0
+    return 1 + int(math.log(seconds / MIN_BUCKETED_COMPILE_TIME,
+                            COMPILE_TIME_BUCKET_RATIO))
+
+
+def _get_most_included_headers(closures, sources, count):
+    """ The ``count`` headers that most of ``sources`` depend on (directly
+    or not), most used first. Headers used by a single source are left
+    out, as precompiling them saves nothing. """
+    uses = collections.defaultdict(int)
+    for source in sources:
+        for dep in closures[source]:
+            if _has_extension(dep, HEADER_EXTENSIONS):
+                uses[dep] += 1
+    ranked = sorted((-n, header) for header, n in uses.items() if n > 1)
+    return [header for _n, header in ranked[:count]]
+
+
+def _get_precompiled_header(config, dependencies, objects, generated):
+    """ Add a header that includes the ``pch_headers`` most included headers
+    to ``generated``, and return its path. Every object is compiled with
+    ``-include`` it, so the compiler uses its precompiled version.
+
+    Returns the path of the header and the files it depends on. """
+    closures = _transitive_closure(dependencies)
+    headers = _get_most_included_headers(
+        closures, [path for path, _obj, _deps in objects],
+        config.pch_headers)
+    if not headers:
+        return None, []
+    logging.info("Precompiling %s", ", ".join(headers))
+    pch = os.path.join(config.compiled_subdir, PCH_HEADER)
+    generated[pch] = _get_generated_source(
+        [os.path.relpath(h, config.compiled_subdir) for h in headers])
+    return pch, sorted(set(headers).union(*[closures[h] for h in headers]))
+
+
+def _get_generated_source(includes):
+    lines = ["// Automatically generated by generate_cpp_makefile. "
+             "DO NOT EDIT BY HAND"]
+    lines.extend('#include "{}"'.format(include) for include in includes)
+    return "\n".join(lines) + "\n"
+
+
+def _get_unity_objects(config, objects, target_objects, pic_objects,
+                       generated, batches):
+    """ Batch the sources in unity translation units of
+    ``unity_batch_size`` sources each, written to ``generated``. The
+    sources of each unity source are added to ``batches``.
+
+    Only sources used by the same targets, compiled with the same flags and
+    with the same extension are batched together. Sources that match
+    ``unity_exclude`` (static names that clash, for example) are compiled
+    on their own. Returns ``objects``, ``target_objects`` and
+    ``pic_objects`` for the batched objects.
+    """
+    users = collections.defaultdict(list)
+    for name, target_objs in target_objects.items():
+        for object_fname in target_objs:
+            users[object_fname].append(name)
+    groups = collections.OrderedDict()
+    unity_objects = []
+    for obj in objects:
+        path, object_fname, _deps = obj
+        if _matches_any(_relative_to(path, config.source_dir),
+                        config.unity_exclude):
+            unity_objects.append(obj)
             continue
-        _print("{}: {}".format(path, " ".join(deps)))
-    _print()
+        key = (tuple(users[object_fname]), object_fname in pic_objects,
+               os.path.splitext(path)[1])
+        groups.setdefault(key, []).append(obj)
+    unity_dir = os.path.join(config.compiled_subdir, UNITY_SUBDIR)
+    batched = {}
+    batched_objects = []
+    size = config.unity_batch_size
+    for (_users, pic, extension), group in groups.items():
+        for start in range(0, len(group), size):
+            batch = group[start:start + size]
+            if len(batch) == 1:
+                unity_objects.append(batch[0])
+                continue
+            unity_source = os.path.join(
+                unity_dir, "unity_{}{}".format(len(batched_objects),
+                                               extension))
+            unity_object = _rm_extension(unity_source) + ".o"
+            sources = [path for path, _obj, _deps in batch]
+            deps = set(sources)
+            for _path, object_fname, obj_deps in batch:
+                deps.update(obj_deps)
+                batched[object_fname] = unity_object
+            generated[unity_source] = _get_generated_source(
+                [os.path.relpath(p, unity_dir) for p in sources])
+            batches[unity_source] = sources
+            unity_objects.append((unity_source, unity_object,
+                                  sorted(deps)))
+            batched_objects.append(unity_object)
+            if pic:
+                pic_objects.add(unity_object)
+    unity_target_objects = collections.OrderedDict()
+    for name, target_objs in target_objects.items():
+        unity_target_objs = []
+        for object_fname in target_objs:
+            object_fname = batched.get(object_fname, object_fname)
+            if object_fname not in unity_target_objs:
+                unity_target_objs.append(object_fname)
+        unity_target_objects[name] = unity_target_objs
+    return unity_objects, unity_target_objects, pic_objects
 
-    _print()
-    _print("# Listing object files files")
-    _print()
 
-    _print("OBJS := \\")
-    _print(" \\\n".join(sorted(object_fnames)))
-    _print()
+def _get_compile_flags(plan, object_fname):
+    """ The flags ``object_fname`` is compiled with, on top of the common
+    ones. """
+    flags = []
+    if object_fname in plan.pic_objects:
+        flags.append("-fPIC")
+    if plan.pch is not None:
+        flags.extend(["-include", plan.pch])
+    return flags
 
-    _print("{}: $(OBJS)".format(config.program))
-    _print("\t@echo ' '")
-    _print("\t@echo 'Linking: $@'")
-    _print("\t$(CC) $(CARGS) -o '$@' $(OBJS) $(LIBS)")
-    _print("\t@echo 'Finished building $@'")
-    _print("\t@echo ' '")
-    _print()
-    _print("clean:")
-    _print("\t-rm -rf $(OBJS) {}".format(config.program))
-    _print("\t-@echo ' '")
-    _print()
-    _print(".PHONY: all clean")
+
+def _matches_any(path, patterns):
+    if patterns == ['*']:
+        return True
+    return any(fnmatch.fnmatch(path, p) for p in patterns)
+
+
+def _get_link_inputs(config, target, object_var):
+    """ The inputs of the link of ``target``: its objects and the files of
+    the libraries it links with. """
+    return [object_var] + [_get_target_filename(_get_target(config.targets,
+                                                            link))
+                           for link in target.link]
+
+
+def _makefile_chunks(config, plan, dependencies, timestamp=True,
+                     fragments=None):
+    """ Generate the makefile for ``plan``, a few rules at a time. With
+    ``fragments``, the rules of the source and header files are left out,
+    and the ``fragments`` that have them are included instead. """
+    yield "# Automatically generated makefile. DO NOT EDIT BY HAND\n"
+    if timestamp:
+        # On its own, as it is left out of the content hash
+        yield "{}{}\n".format(TIMESTAMP_PREFIX, datetime.datetime.now())
+    header = [
+        "",
+        "CC := {}".format(config.compiler),
+        "CARGS := {}".format(config.cargs),
+        "INCLUDES := {}".format(" ".join("-I{}".format(d)
+                                         for d in config.extra_include_dirs)),
+        "LIBS := {}".format(" ".join("-l{}".format(l) for l in config.libs)),
+        "",
+        "AR := ar",
+    ]
+    if plan.compile_timer is not None:
+        header.append("TIMER := {}".format(plan.compile_timer))
+    if config.compiler_launcher:
+        header.append("LAUNCHER := {}".format(config.compiler_launcher))
+    header.extend([
+        "",
+        "all: {}".format(" ".join(_get_target_filename(t)
+                                  for t in config.targets)),
+        "",
+        "",
+        "# Source files",
+        "",
+        "",
+    ])
+    yield "\n".join(header)
+
+    if plan.pch is not None:
+        yield ("{pch}.gch: {pch} {deps}\n"
+               "\t$(CC) $(CARGS) $(INCLUDES) -o \"$@\" \"$<\"\n\n"
+               .format(pch=plan.pch, deps=" ".join(plan.pch_deps)))
+
+    if fragments is None:
+        for chunk in _source_rule_chunks(config, plan, plan.objects):
+            yield chunk
+        yield "\n# Header files\n\n"
+        for chunk in _header_rule_chunks(sorted(dependencies.items())):
+            yield chunk
+        yield "\n"
+    else:
+        yield "".join("include {}\n".format(f) for f in fragments)
+        yield "\n"
+
+    yield "\n# Listing object files files\n\nOBJS := \\\n"
+    yield " \\\n".join(o for _path, o, _deps in plan.objects)
+    yield "\n\n"
+
+    for target in config.targets:
+        yield _get_link_rule(config, plan, target)
+    yield ("clean:\n"
+           "\t-rm -rf $(OBJS) {}\n"
+           "\t-@echo ' '\n"
+           "\n"
+           ".PHONY: all clean\n"
+           "\n"
+           "# Dependencies found by the compiler on the last build\n"
+           "-include $(OBJS:%.o=%.d)\n"
+           .format(" ".join(
+               [_get_target_filename(t) for t in config.targets] +
+               ([plan.pch + ".gch"] if plan.pch is not None else []))))
+
+
+def _get_link_rule(config, plan, target):
+    object_var = "$({})".format(_get_objects_variable(target))
+    inputs = " ".join(_get_link_inputs(config, target, object_var))
+    libs = "".join(" -l{}".format(l) for l in target.libs)
+    if target.kind == 'static_library':
+        command = "$(AR) rcs '$@' {}".format(object_var)
+    elif target.kind == 'shared_library':
+        command = "$(CC) $(CARGS) -shared -o '$@' {} $(LIBS){}".format(
+            inputs, libs)
+    else:
+        command = "$(CC) $(CARGS) -o '$@' {} $(LIBS){}".format(inputs, libs)
+    return ("{var} := \\\n{objects}\n\n"
+            "{target}: {inputs}\n"
+            "\t@echo ' '\n"
+            "\t@echo 'Linking: $@'\n"
+            "\t{command}\n"
+            "\t@echo 'Finished building $@'\n"
+            "\t@echo ' '\n\n"
+            .format(var=_get_objects_variable(target),
+                    objects=" \\\n".join(plan.target_objects[target.name]),
+                    target=_get_target_filename(target), inputs=inputs,
+                    command=command))
+
+
+def _source_rule_chunks(config, plan, objects, batch_size=256):
+    """ Generate the compile rules of ``objects``, ``batch_size`` rules per
+    chunk. """
+    prefix = "" if plan.compile_timer is None else "$(TIMER) \"$@\" "
+    if config.compiler_launcher:
+        prefix += "$(LAUNCHER) "
+    # Objects are compiled with one of a few flag sets: format the command
+    # of each set once
+    commands = {}
+    pch_dep = "" if plan.pch is None else " {}.gch".format(plan.pch)
+    rules = []
+    for path, object_fname, deps in objects:
+        pic = object_fname in plan.pic_objects
+        command = commands.get(pic)
+        if command is None:
+            flags = "".join(" " + f for f in _get_compile_flags(
+                plan, object_fname))
+            command = commands[pic] = (
+                "\t{}$(CC) $(CARGS){} $(INCLUDES) -c -MMD -MP "
+                "-MF\"$(@:%.o=%.d)\" -MT\"$@\" -o \"$@\" \"$<\" $(LIBS)\n\n"
+                .format(prefix, flags))
+        rules.append("".join([
+            object_fname, ": ", path, " ", " ".join(deps), pch_dep,
+            "\n\t-@mkdir -p ", os.path.dirname(object_fname), "\n",
+            command]))
+        if len(rules) == batch_size:
+            yield "".join(rules)
+            rules = []
+    if rules:
+        yield "".join(rules)
+
+
+def _header_rule_chunks(dependencies, batch_size=1024):
+    rules = []
+    for path, deps in dependencies:
+        if _has_extension(path, HEADER_EXTENSIONS):
+            rules.append("".join([path, ": ", " ".join(deps), "\n"]))
+            if len(rules) == batch_size:
+                yield "".join(rules)
+                rules = []
+    if rules:
+        yield "".join(rules)
+
+
+def _get_fragment_filename(config, dirname):
+    return os.path.normpath(os.path.join(
+        config.compiled_subdir, FRAGMENTS_SUBDIR,
+        _get_fragment_key(dirname), FRAGMENT_FILE))
+
+
+def _get_fragment_key(dirname):
+    """ A relative path for the fragment of ``dirname``, that stays in the
+    fragments directory even if ``dirname`` is absolute or outside of the
+    current one: ``/usr/include`` -> ``__root__/usr/include`` and
+    ``../lib`` -> ``__parent__/lib``. """
+    dirname = os.path.normpath(dirname)
+    parts = []
+    if os.path.isabs(dirname):
+        parts.append(FRAGMENT_ROOT_DIR)
+        dirname = os.path.relpath(dirname, os.sep)
+    parts.extend(FRAGMENT_PARENT_DIR if part == os.pardir else part
+                 for part in dirname.split(os.sep))
+    return os.path.join(*parts)
+
+
+def _get_fragments(config, plan, dependencies):
+    """ Split the rules of the source and header files by directory. Returns
+    a map from each fragment makefile to its objects and headers. """
+    fragments = collections.defaultdict(lambda: ([], []))
+    for obj in plan.objects:
+        fragments[os.path.dirname(obj[0])][0].append(obj)
+    for path, deps in sorted(dependencies.items()):
+        fragments[os.path.dirname(path)][1].append((path, deps))
+    return dict((_get_fragment_filename(config, dirname),
+                 (dirname, objects, headers))
+                for dirname, (objects, headers) in fragments.items())
+
+
+def _fragment_chunks(config, plan, dirname, objects, headers):
+    yield ("# Automatically generated makefile fragment for {}. "
+           "DO NOT EDIT BY HAND\n\n".format(dirname or os.curdir))
+    for chunk in _source_rule_chunks(config, plan, objects):
+        yield chunk
+    for chunk in _header_rule_chunks(headers):
+        yield chunk
+
+
+def _write_split_makefile(options, plan, dependencies):
+    """ Write a makefile fragment for each directory, only if it changed,
+    and a makefile that includes them. Fragments of directories that are
+    gone are deleted. Returns whether the makefile was written.
+
+    Every fragment is still rendered (to compare it with the existing
+    one), and make still reads all of them: only the writes, and the
+    fragments whose mtime changes, scale with the change. """
+    config = options.config
+    fragments = _get_fragments(config, plan, dependencies)
+    written = sum(_write_if_changed(fname, _fragment_chunks(config, plan,
+                                                            *fragment))
+                  for fname, fragment in fragments.items())
+    fragments_dir = os.path.join(config.compiled_subdir, FRAGMENTS_SUBDIR)
+    for path, _subdirs, fnames in os.walk(fragments_dir):
+        for fname in fnames:
+            fullpath = os.path.normpath(os.path.join(path, fname))
+            if fullpath not in fragments:
+                os.remove(fullpath)
+    if written:
+        logging.info("%d of %d makefile fragments updated", written,
+                     len(fragments))
+    return _write_if_changed("makefile", _makefile_chunks(
+        config, plan, dependencies, not options.no_timestamp,
+        sorted(fragments)))
+
+
+def _get_objects_variable(target):
+    name = re.sub(r'[^A-Za-z0-9]', '_', target.name).upper()
+    return "{}_OBJS".format(name)
+
+
+def _ninja_escape(path):
+    return path.replace("$", "$$").replace(" ", "$ ").replace(":", "$:")
+
+
+def _ninja_chunks(config, plan, dependencies, timestamp=True):
+    # pylint: disable=unused-argument
+    def _paths(paths):
+        return " ".join(_ninja_escape(p) for p in paths)
+
+    yield "# Automatically generated build.ninja. DO NOT EDIT BY HAND\n"
+    if timestamp:
+        yield "{}{}\n".format(TIMESTAMP_PREFIX, datetime.datetime.now())
+    yield "\n".join([
+        "",
+        "ninja_required_version = 1.3",
+        "builddir = {}".format(config.compiled_subdir),
+        "cc = {}".format(config.compiler),
+        "launcher = {}".format(config.compiler_launcher),
+        "cargs = {}".format(config.cargs),
+        "includes = {}".format(" ".join("-I{}".format(d)
+                                        for d in config.extra_include_dirs)),
+        "libs = {}".format(" ".join("-l{}".format(l) for l in config.libs)),
+        "",
+        "rule cc",
+        "  command = $launcher $cc $cargs $includes -c -MMD -MF $out.d "
+        "-o $out $in",
+        "  depfile = $out.d",
+        "  deps = gcc",
+        "  description = CC $out",
+        "",
+        "rule pch",
+        "  command = $cc $cargs $includes -MMD -MF $out.d -o $out $in",
+        "  depfile = $out.d",
+        "  deps = gcc",
+        "  description = PCH $out",
+        "",
+        "rule link",
+        "  command = $cc $cargs -o $out $in $libs",
+        "  description = LINK $out",
+        "",
+        "rule link_shared",
+        "  command = $cc $cargs -shared -o $out $in $libs",
+        "  description = LINK $out",
+        "",
+        "rule archive",
+        "  command = rm -f $out && ar rcs $out $in",
+        "  description = AR $out",
+        "",
+        "# Source files",
+        "",
+        "",
+    ])
+
+    if plan.pch is not None:
+        yield "build {}.gch: pch {} | {}\n".format(
+            _ninja_escape(plan.pch), _ninja_escape(plan.pch),
+            _paths(plan.pch_deps))
+    edges = []
+    for path, object_fname, deps in plan.objects:
+        if plan.pch is not None:
+            deps = deps + [plan.pch + ".gch"]
+        implicit = " | {}".format(_paths(deps)) if deps else ""
+        edges.append("build {}: cc {}{}\n".format(
+            _ninja_escape(object_fname), _ninja_escape(path), implicit))
+        flags = _get_compile_flags(plan, object_fname)
+        if flags:
+            edges.append("  cargs = $cargs {}\n".format(" ".join(flags)))
+        if len(edges) >= 512:
+            yield "".join(edges)
+            edges = []
+    edges.append("\n")
+    yield "".join(edges)
+
+    rules = {'program': 'link', 'static_library': 'archive',
+             'shared_library': 'link_shared'}
+    for target in config.targets:
+        inputs = plan.target_objects[target.name] + [
+            _get_target_filename(_get_target(config.targets, link))
+            for link in target.link]
+        yield "build {}: {} {}\n".format(
+            _ninja_escape(_get_target_filename(target)), rules[target.kind],
+            _paths(inputs))
+        if target.libs:
+            yield "  libs = $libs {}\n".format(
+                " ".join("-l{}".format(l) for l in target.libs))
+    yield "\ndefault {}\n".format(_paths(_get_target_filename(t)
+                                         for t in config.targets))
+
+
+BACKENDS = {
+    'make': ('makefile', _makefile_chunks),
+    'ninja': ('build.ninja', _ninja_chunks),
+}
 
 
 if __name__ == "__main__":
@@ -18,7 +18,9 @@ from __future__ import absolute_import, unicode_literals, division
 
 from .mock_nt import mock_namedtuple, mock_namedtuple_class
 from .nt_with_defaults import namedtuple_with_defaults
+from .record import record_with_defaults
 
 __all__ = ['mock_namedtuple',
            'mock_namedtuple_class',
-           'namedtuple_with_defaults', ]
+           'namedtuple_with_defaults',
+           'record_with_defaults', ]
@@ -0,0 +1,123 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015 Ignacio Rossi
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library; if not, see <http://www.gnu.org/licenses/>.
+from __future__ import absolute_import, unicode_literals
+
+import collections
+import logging
+import sys
+import threading
+import weakref
+
+import six
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+DEFAULT_MAXSIZE = 256
+
+
+class ClassCache(object):
+    """ Bounded LRU cache for generated classes.
+
+    Classes are held through weak references, so the cache never keeps a
+    class alive by itself: dead entries are dropped as soon as their class is
+    garbage collected.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self._maxsize = maxsize
+        self._classes = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key):
+        """ Return the class cached under ``key``, or ``None``. """
+        with self._lock:
+            try:
+                ref = self._classes.pop(key)
+            except KeyError:
+                return None
+            cls = ref()
+            if cls is not None:
+                self._classes[key] = ref
+            return cls
+
+    def set(self, key, cls):
+        """ Cache ``cls`` under ``key``, evicting the oldest entries. """
+        ref = weakref.ref(cls, self._get_remover(key))
+        with self._lock:
+            self._classes.pop(key, None)
+            self._classes[key] = ref
+            while len(self._classes) > self._maxsize:
+                self._classes.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._classes.clear()
+
+    def __len__(self):
+        return len(self._classes)
+
+    def _get_remover(self, key):
+        def _remove(ref):
+            with self._lock:
+                if self._classes.get(key) is ref:
+                    del self._classes[key]
+        return _remove
+
+
+def freeze(value):
+    """ Build a hashable cache key part from ``value``.
+
+    Strings are split as :py:func:`collections.namedtuple` splits its fields,
+    and dicts are frozen by content, tagging the values with their type so
+    that ``1`` and ``True`` don't collide. Unhashable values fall back to
+    their identity, so they must be kept alive by the cached class.
+    """
+    if isinstance(value, six.string_types):
+        return tuple(value.replace(',', ' ').split())
+    if isinstance(value, dict):
+        return frozenset((k, type(v), _freeze_item(v))
+                         for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze_item(v) for v in value)
+    return _freeze_item(value)
+
+
+def _freeze_item(value):
+    try:
+        hash(value)
+    except TypeError:
+        return ('id', id(value))
+    return value
+
+
+def get_caller_module(depth=2):
+    """ Name of the module ``depth`` frames up the stack (by default, the
+    module that called the function calling this), or ``None`` if it can't
+    be found. Used as ``__module__`` for generated classes, and as part of
+    their cache keys.
+    """
+    # Stolen from: collections.namedtuple
+    # For pickling to work, the __module__ variable needs to be set to the
+    # frame where the named tuple is created.  Bypass this step in environments
+    # where sys._getframe is not defined (Jython for example) or sys._getframe
+    # is not defined for arguments greater than 0 (IronPython).
+    try:
+        # pylint: disable=protected-access
+        return sys._getframe(depth).f_globals.get('__name__', '__main__')
+    except (AttributeError, ValueError):
+        return None
+    # /Stolen
@@ -18,8 +18,15 @@ from __future__ import absolute_import, unicode_literals
 
 import logging
 
+from .class_cache import ClassCache
+
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+_CLASS_CACHE = ClassCache()
+
+# Value of the fields that were not set in the mock
+_MISSING = object()
+
 
 def mock_namedtuple_class(tuple_class):
     """
@@ -30,6 +37,9 @@ def mock_namedtuple_class(tuple_class):
     the needed data fields, and avoids issues if an unrelated part of the
     namedtuple schema changes.
 
+    Mock classes are cached, so repeated calls with the same ``tuple_class``
+    return the same mock class.
+
     Args:
         tuple_class(type): Namedtuple class to wrap
     Return:
@@ -45,35 +55,44 @@ def mock_namedtuple_class(tuple_class):
     AttributeError: Missing 'b' field in 'Tuple' mock. (id=140371982628528)
 
     """
+    key = id(tuple_class)
+    cached = _CLASS_CACHE.get(key)
+    if cached is not None and cached.__bases__ == (tuple_class,):
+        return cached
 
     class MockTuple(tuple_class):
         # pylint: disable=no-init,too-few-public-methods
-        __EXCEPTION_SENTINEL = object()
-
         def __new__(cls, **kwargs):
             for field in kwargs:
                 if field not in tuple_class._fields:
                     raise ValueError("'{}' is not a valid field for {}".format(
                         field, tuple_class))
-            values = [kwargs.get(f, cls.__EXCEPTION_SENTINEL)
-                      for f in tuple_class._fields]
-            return tuple_class.__new__(cls, *values)
-
-        def __getattribute__(self, attr):
-            # Avoid recursion filtering self._* lookups without doing self._*
-            # lookups
-            value = tuple_class.__getattribute__(self, attr)
-            if attr.startswith("_"):
-                return value
-            if value == self.__EXCEPTION_SENTINEL:
-                raise AttributeError("Missing '{}' field in '{}' mock. (id={})"
-                                     .format(attr, tuple_class.__name__,
-                                             id(self)))
-            return value
+            # Bypass tuple_class.__new__, which may convert or validate the
+            # values (see namedtuple_with_defaults)
+            return tuple.__new__(cls, [kwargs.get(f, _MISSING)
+                                       for f in tuple_class._fields])
 
+    for index, field in enumerate(tuple_class._fields):
+        setattr(MockTuple, field,
+                _mock_field(index, field, tuple_class.__name__))
+
+    _CLASS_CACHE.set(key, MockTuple)
     return MockTuple
 
 
+def _mock_field(index, field, tuple_name):
+    getitem = tuple.__getitem__
+
+    def _get(self):
+        value = getitem(self, index)
+        if value is _MISSING:
+            raise AttributeError("Missing '{}' field in '{}' mock. (id={})"
+                                 .format(field, tuple_name, id(self)))
+        return value
+
+    return property(_get, doc="Alias for field number {}".format(index))
+
+
 def mock_namedtuple(tuple_class, **kwargs):
     """
     Create a mock namedtuple instance, with the given ``tuple_class`` and
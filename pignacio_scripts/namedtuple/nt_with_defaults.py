@@ -18,20 +18,36 @@ from __future__ import absolute_import, unicode_literals
 
 import collections
 import logging
-import sys
+
+from .class_cache import ClassCache, freeze, get_caller_module
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+_CLASS_CACHE = ClassCache()
+
 
-def namedtuple_with_defaults(tuple_name, fields, defaults=None):
+def namedtuple_with_defaults(tuple_name, fields, defaults=None, types=None,
+                             converters=None, validate=True):
     '''
     Create a :py:class:`collections.namedtuple` subclass with the given
     ``name`` and ``fields`` which has default values for some fields.
 
+    Optionally, fields can be given converters (applied to the value on
+    construction) and types (checked with ``isinstance`` after conversion).
+    Both are compiled into the constructor once, when the class is created.
+    Type checking can be disabled with ``validate=False``, in which case the
+    constructor does not pay for it at all.
+
+    Classes are cached: asking again for the same name, fields, defaults,
+    types and converters from the same module returns the same class.
+
     Args:
         tuple_name (str): namedtuple's name.
         fields (str,list): namedtuple's field.
         defaults (dict): the namedtuple's defaults.
+        types (dict): expected type (or tuple of types) for some fields.
+        converters (dict): callable applied to some fields' values.
+        validate (bool): whether to check ``types`` on construction.
 
     Returns:
         type: the new namedtuple class
@@ -42,9 +58,33 @@ def namedtuple_with_defaults(tuple_name, fields, defaults=None):
     MyTuple(a=3, b=5)
     >>> MyTuple(a=1, b=2)
     MyTuple(a=1, b=2)
+    >>> IntTuple = namedtuple_with_defaults('IntTuple', ['a'],
+    ...                                     converters={'a': int})
+    >>> IntTuple(a='3')
+    IntTuple(a=3)
     '''
     defaults = defaults or {}
+    if isinstance(defaults, dict):
+        # The class must not see later changes to the caller's dict, as the
+        # cache key is its content now
+        defaults = dict(defaults)
+    module = get_caller_module()
+    key = (tuple_name, freeze(fields), freeze(defaults), freeze(types),
+           freeze(converters), validate, module)
+    try:
+        cached = _CLASS_CACHE.get(key)
+    except TypeError:  # Unhashable key part
+        key = cached = None
+    if cached is not None:
+        return cached
+
     tuple_class = collections.namedtuple(tuple_name, fields)
+    field_converters = _compile_field_map(tuple_class, converters,
+                                          'converters')
+    # Unknown fields in ``types`` are reported even if validation is off
+    field_types = _compile_field_map(tuple_class, types, 'types')
+    if not validate:
+        field_types = ()
 
     # pylint: disable=no-init,too-few-public-methods
     class NamedTuple(tuple_class):
@@ -57,15 +97,22 @@ def namedtuple_with_defaults(tuple_name, fields, defaults=None):
                                  'instead of {}'
                                  .format(len(args), len(tuple_class._fields)))
             defaults = cls.__get_defaults()
-            fields_in_args = set(tuple_class._fields[:len(args)])
-            kwvalues = {
-                f: cls.__extract_value(f, kwargs, defaults)
-                for f in tuple_class._fields if f not in fields_in_args
-            }
+            values = list(args)
+            values.extend(cls.__extract_value(f, kwargs, defaults)
+                          for f in tuple_class._fields[len(args):])
             if kwargs:
                 raise ValueError('Unexpected argument for namedtuple: {}'
                                  .format(kwargs.popitem()[0]))
-            return tuple_class.__new__(cls, *args, **kwvalues)
+            for index, converter in field_converters:
+                values[index] = converter(values[index])
+            for index, field_type in field_types:
+                if not isinstance(values[index], field_type):
+                    raise TypeError(
+                        "Invalid type for namedtuple field '{}': expected "
+                        "{}, got {}".format(tuple_class._fields[index],
+                                            _type_names(field_type),
+                                            type(values[index]).__name__))
+            return tuple_class.__new__(cls, *values)
 
         @staticmethod
         def __extract_value(key, kwargs, defaults):
@@ -86,17 +133,29 @@ def namedtuple_with_defaults(tuple_name, fields, defaults=None):
                 return cls.__defaults
 
     NamedTuple.__name__ = str(tuple_name)  # Prevent unicode in Python 2.x
+    # Python 3 pickles classes by their qualified name
+    NamedTuple.__qualname__ = NamedTuple.__name__
 
-    # Stolen from: collections.namedtuple
-    # For pickling to work, the __module__ variable needs to be set to the
-    # frame where the named tuple is created.  Bypass this step in environments
-    # where sys._getframe is not defined (Jython for example) or sys._getframe
-    # is not defined for arguments greater than 0 (IronPython).
-    try:
-        # pylint: disable=protected-access
-        NamedTuple.__module__ = sys._getframe(1).f_globals.get('__name__',
-                                                               '__main__')
-    except (AttributeError, ValueError):
-        pass
-    # /Stolen
+    if module is not None:
+        NamedTuple.__module__ = module
+    if key is not None:
+        _CLASS_CACHE.set(key, NamedTuple)
     return NamedTuple
+
+
+def _compile_field_map(tuple_class, field_map, kind):
+    if not field_map:
+        return ()
+    for field in field_map:
+        if field not in tuple_class._fields:
+            raise ValueError("'{}' is not a valid field for {} {}"
+                             .format(field, tuple_class.__name__, kind))
+    return tuple((index, field_map[field])
+                 for index, field in enumerate(tuple_class._fields)
+                 if field in field_map)
+
+
+def _type_names(field_type):
+    if isinstance(field_type, tuple):
+        return ' or '.join(t.__name__ for t in field_type)
+    return field_type.__name__
@@ -0,0 +1,225 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015 Ignacio Rossi
+#
+# This library is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library; if not, see <http://www.gnu.org/licenses/>.
+from __future__ import absolute_import, unicode_literals
+
+import collections
+import keyword
+import logging
+import re
+
+import six
+
+from .class_cache import ClassCache, freeze, get_caller_module
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+_CLASS_CACHE = ClassCache()
+
+_NAME_RE = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
+_FIELD_RE = re.compile(r'^[a-zA-Z][a-zA-Z0-9_]*$')
+
+# Value of the __init__ arguments that were not given
+_MISSING = object()
+
+_CLASS_TEMPLATE = '''\
+def __init__(_self, {init_args}*_args, **_kwargs):
+    if _args:
+        raise ValueError('Too many arguments for record: got {{}} instead of '
+                         '{nfields}'.format({nfields} + _len(_args)))
+    if _kwargs:
+        raise ValueError('Unexpected argument for record: {{}}'
+                         .format(_kwargs.popitem()[0]))
+{init_defaults}{init_body}
+
+def _replace(_self, **_kwargs):
+    _values = ({replace_values})
+    if _kwargs:
+        raise ValueError('Unexpected argument for record: {{}}'
+                         .format(_kwargs.popitem()[0]))
+    return _self.__class__(*_values)
+
+def _asdict(_self):
+    return _OrderedDict([{asdict_items}])
+
+def __repr__(_self):
+    return '{name}({repr_format})'.format({self_values})
+
+def __eq__(_self, _other):
+    if _other.__class__ is not _self.__class__:
+        return NotImplemented
+    return ({self_values}) == ({other_values})
+
+def __ne__(_self, _other):
+    _equal = _self.__eq__(_other)
+    return _equal if _equal is NotImplemented else not _equal
+
+def __hash__(_self):
+    return hash(({self_values}))
+
+def __reduce__(_self):
+    return (_self.__class__, ({self_values}))
+'''
+
+_FROZEN_TEMPLATE = '''
+def __setattr__(_self, _name, _value):
+    raise AttributeError("Cannot set '{{}}' on frozen record '{name}'"
+                         .format(_name))
+
+def __delattr__(_self, _name):
+    raise AttributeError("Cannot delete '{{}}' on frozen record '{name}'"
+                         .format(_name))
+'''
+
+
+def record_with_defaults(record_name, fields, defaults=None, frozen=False):
+    '''
+    Create a mutable record class with the given ``name`` and ``fields``,
+    which has default values for some fields.
+
+    It's the ``__slots__`` based sibling of
+    :py:func:`~.nt_with_defaults.namedtuple_with_defaults`:
+    the fields and defaults work the same way, but the values can be changed
+    after construction (unless ``frozen`` is set). Instances take about the
+    same memory as a tuple, and the ``__init__``, ``_replace``, ``_asdict``
+    and comparison methods are generated for the given fields.
+
+    Frozen records are hashable, mutable ones are not.
+
+    Args:
+        record_name (str): record's name.
+        fields (str,list): record's field.
+        defaults (dict): the record's defaults. Can also be a function with no
+            arguments returning them, for mutable defaults.
+        frozen (bool): whether fields can be set after construction.
+
+    Returns:
+        type: the new record class
+
+
+    >>> Record = record_with_defaults('Record', ['a', 'b'], {'b': 5})
+    >>> record = Record(a=3)
+    >>> record
+    Record(a=3, b=5)
+    >>> record.b = 4
+    >>> record._replace(a=1)
+    Record(a=1, b=4)
+    '''
+    defaults = defaults or {}
+    if isinstance(defaults, dict):
+        # The class must not see later changes to the caller's dict, as the
+        # cache key is its content now
+        defaults = dict(defaults)
+    module = get_caller_module()
+    key = (record_name, freeze(fields), freeze(defaults), frozen, module)
+    cached = _CLASS_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    if not _NAME_RE.match(record_name) or keyword.iskeyword(record_name):
+        raise ValueError("'{}' is not a valid record name"
+                         .format(record_name))
+    fields = _parse_fields(fields)
+    namespace = {
+        '_MISSING': _MISSING,
+        # Fields may shadow builtins (a field named ``len``, for example)
+        '_len': len,
+        '_OrderedDict': collections.OrderedDict,
+        '_get_defaults': (defaults if callable(defaults)
+                          else lambda: defaults),
+        '_get_default': _get_default,
+        '_setattr': object.__setattr__,
+    }
+    source = _get_source(record_name, fields, frozen)
+    six.exec_(source, namespace)
+
+    class_dict = {
+        name: namespace[name]
+        for name in ('__init__', '_replace', '_asdict', '__repr__', '__eq__',
+                     '__ne__', '__hash__', '__reduce__', '__setattr__',
+                     '__delattr__')
+        if name in namespace
+    }
+    if not frozen:
+        class_dict['__hash__'] = None
+    class_dict.update(__slots__=fields, _fields=fields, _source=source,
+                      __doc__='{}({})'.format(record_name, ', '.join(fields)))
+    if module is not None:
+        class_dict['__module__'] = module
+    record_class = type(str(record_name), (object,), class_dict)
+
+    _CLASS_CACHE.set(key, record_class)
+    return record_class
+
+
+def _parse_fields(fields):
+    if isinstance(fields, six.string_types):
+        fields = fields.replace(',', ' ').split()
+    fields = tuple(str(f) for f in fields)
+    seen = set()
+    for field in fields:
+        if not _FIELD_RE.match(field) or keyword.iskeyword(field):
+            raise ValueError("'{}' is not a valid field name for a record"
+                             .format(field))
+        if field in seen:
+            raise ValueError("Duplicate field name in record: '{}'"
+                             .format(field))
+        seen.add(field)
+    return fields
+
+
+def _get_default(defaults, field):
+    try:
+        return defaults[field]
+    except KeyError:
+        raise ValueError("Missing argument for record: '{}'".format(field))
+
+
+def _get_source(record_name, fields, frozen):
+    def _tuple(values):
+        return ''.join('{}, '.format(v) for v in values)
+
+    if frozen:
+        set_template = "    _setattr(_self, '{0}', {0})\n"
+    else:
+        set_template = "    _self.{0} = {0}\n"
+    init_defaults = ''
+    if fields:
+        init_defaults = '    if {}:\n        _defaults = _get_defaults()\n'
+        init_defaults = init_defaults.format(
+            ' or '.join('{} is _MISSING'.format(f) for f in fields))
+        init_defaults += ''.join(
+            "        if {0} is _MISSING:\n"
+            "            {0} = _get_default(_defaults, '{0}')\n".format(f)
+            for f in fields)
+
+    source = _CLASS_TEMPLATE.format(
+        name=record_name,
+        nfields=len(fields),
+        init_args=_tuple('{}=_MISSING'.format(f) for f in fields),
+        init_defaults=init_defaults,
+        init_body=''.join(set_template.format(f) for f in fields) or
+        '    pass\n',
+        replace_values=_tuple("_kwargs.pop('{0}', _self.{0})".format(f)
+                              for f in fields),
+        asdict_items=_tuple("('{0}', _self.{0})".format(f) for f in fields),
+        repr_format=', '.join('{}={{!r}}'.format(f) for f in fields),
+        self_values=_tuple('_self.{}'.format(f) for f in fields),
+        other_values=_tuple('_other.{}'.format(f) for f in fields),
+    )
+    if frozen:
+        source += _FROZEN_TEMPLATE.format(name=record_name)
+    return source
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+# generate_cpp_makefile is a standalone script, not part of the package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, os.pardir, 'pignacio_scripts',
+                                'makefile_generator', 'src'))
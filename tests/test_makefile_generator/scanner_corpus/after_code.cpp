@@ -0,0 +1,6 @@
+#include "a.h"
+int x;
+#include "after_code.h"
+#if 0
+#include "in_if.h"
+#endif
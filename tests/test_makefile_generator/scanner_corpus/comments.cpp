@@ -0,0 +1,9 @@
+/*
+ * A block comment
+ */
+// #include "line_comment.h"
+/* #include "block_comment.h" */
+#include "a.h"  // trailing comment
+#include <vector> /* trailing block comment */
+
+int main() { return 0; }
@@ -0,0 +1,5 @@
+#ifndef CRLF_H
+#define CRLF_H
+#include "a.h"
+#include <map>
+#endif
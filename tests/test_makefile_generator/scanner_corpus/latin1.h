@@ -0,0 +1,4 @@
+// Caf con lea
+#include "caf.h"
+#include "a.h"
+char c = '';
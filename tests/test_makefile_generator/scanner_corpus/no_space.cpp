@@ -0,0 +1,6 @@
+#include<vector>
+#include"a.h"
+#  include "not_matched.h"
+	#include "indented.h"
+#include_next <not_matched>
+int x;
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=protected-access,invalid-name
+from __future__ import absolute_import, unicode_literals
+
+import io
+import logging
+
+from nose.tools import eq_
+
+from generate_cpp_makefile import (SourceTree, _defines_main,
+                                   _get_rebuild_fan_out,
+                                   _get_unreachable_sources, _print_analysis,
+                                   _transitive_closure)
+
+from .utils import TreeTestCase
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# main.cpp uses util (through util.h), util uses log (through log.h), and
+# nothing uses dead.cpp nor unused.h
+TREE = {
+    'src/main.cpp': '#include "util.h"\n\nint main() { return util(); }\n',
+    'src/util.h': '#include "common.h"\nint util();\n',
+    'src/util.cpp': '#include "util.h"\n#include "log.h"\n',
+    'src/log.h': '#include "common.h"\n',
+    'src/log.cpp': '#include "log.h"\n',
+    'src/dead.cpp': '#include "common.h"\n',
+    'src/common.h': '',
+    'src/unused.h': '#include "common.h"\n',
+}
+
+
+class AnalyzeTest(TreeTestCase):
+    def setUp(self):
+        super(AnalyzeTest, self).setUp()
+        self.write_tree(TREE)
+        self.tree = SourceTree('src')
+        self.tree.scan()
+
+    def _get_unreachable_sources(self):
+        return _get_unreachable_sources(
+            self.tree, _transitive_closure(self.tree.dependencies))
+
+    def test_rebuild_fan_out(self):
+        fan_out = _get_rebuild_fan_out(self.tree.dependencies)
+        eq_(dict((h, len(users)) for h, users in fan_out.items()), {
+            'src/common.h': 4,
+            'src/util.h': 2,
+            'src/log.h': 2,
+            'src/unused.h': 0,
+        })
+        eq_(fan_out['src/log.h'], set(['src/util.cpp', 'src/log.cpp']))
+
+    def test_defines_main(self):
+        self.assertTrue(_defines_main('src/main.cpp'))
+        self.assertFalse(_defines_main('src/util.cpp'))
+        self.write_tree({'other.cpp': 'auto main() -> int {}\n',
+                         'call.cpp': 'int x = main();\n'})
+        self.assertTrue(_defines_main('other.cpp'))
+        self.assertFalse(_defines_main('call.cpp'))
+
+    def test_unreachable_sources(self):
+        eq_(self._get_unreachable_sources(), ['src/dead.cpp'])
+
+    def test_no_main(self):
+        self.write_tree({'src/main.cpp': '#include "util.h"\n'})
+        self.tree.scan()
+        self.assertIsNone(self._get_unreachable_sources())
+
+    def _print_analysis(self, top=20):
+        fout = io.StringIO()
+        _print_analysis(fout, self.tree, top)
+        return fout.getvalue().split('\n\n')
+
+    def test_report(self):
+        fan_out, unused, unreachable = self._print_analysis(top=2)
+        eq_(fan_out.splitlines(), [
+            '# Rebuild fan-out: objects rebuilt when a header changes '
+            '(of 4)',
+            '       4 100.0% src/common.h',
+            '       2  50.0% src/log.h',
+        ])
+        eq_(unused.splitlines(),
+            ['# Headers no source includes, directly or not (1)',
+             'src/unused.h'])
+        eq_(unreachable.splitlines(),
+            ['# Sources not used from any source defining main (1)',
+             'src/dead.cpp'])
+
+    def test_report_without_main(self):
+        self.write_tree({'src/main.cpp': '#include "util.h"\n'})
+        self.tree.scan()
+        eq_(self._print_analysis()[-1].strip(),
+            '# No source defines main, skipped the unused sources check')
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=protected-access,invalid-name
+from __future__ import absolute_import, unicode_literals
+
+import logging
+
+from nose.tools import eq_
+
+from generate_cpp_makefile import (_strongly_connected_components,
+                                   _transitive_closure)
+
+from pignacio_scripts.testing import TestCase
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def _components(graph):
+    return [sorted(c) for c in _strongly_connected_components(graph)]
+
+
+class StronglyConnectedComponentsTest(TestCase):
+    def test_chain_is_in_reverse_topological_order(self):
+        graph = {'a': ['b'], 'b': ['c'], 'c': []}
+        eq_(_components(graph), [['c'], ['b'], ['a']])
+
+    def test_cycle_is_one_component(self):
+        graph = {'a': ['b'], 'b': ['c'], 'c': ['b', 'd'], 'd': []}
+        eq_(_components(graph), [['d'], ['b', 'c'], ['a']])
+
+    def test_nodes_without_entry(self):
+        eq_(_components({'a': ['b']}), [['b'], ['a']])
+
+    def test_deep_chain(self):
+        graph = dict((i, [i + 1]) for i in range(10000))
+        eq_(len(_components(graph)), 10001)
+
+
+class TransitiveClosureTest(TestCase):
+    def test_chain(self):
+        graph = {'a': ['b'], 'b': ['c'], 'c': []}
+        eq_(_transitive_closure(graph),
+            {'a': set(['b', 'c']), 'b': set(['c']), 'c': set()})
+
+    def test_diamond(self):
+        graph = {'a': ['b', 'c'], 'b': ['d'], 'c': ['d'], 'd': []}
+        eq_(_transitive_closure(graph)['a'], set(['b', 'c', 'd']))
+
+    def test_cycle_members_reach_each_other(self):
+        graph = {'a': ['b'], 'b': ['c'], 'c': ['b', 'd'], 'd': []}
+        closures = _transitive_closure(graph)
+        eq_(closures['a'], set(['b', 'c', 'd']))
+        eq_(closures['b'], set(['b', 'c', 'd']))
+        eq_(closures['c'], set(['b', 'c', 'd']))
+        eq_(closures['d'], set())
+
+    def test_self_include(self):
+        closures = _transitive_closure({'a': ['a', 'b'], 'b': []})
+        eq_(closures['a'], set(['a', 'b']))
+        eq_(closures['b'], set())
+
+    def test_deep_chain(self):
+        graph = dict((i, [i + 1]) for i in range(2000))
+        eq_(len(_transitive_closure(graph)[0]), 2000)
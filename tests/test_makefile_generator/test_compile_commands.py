@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=protected-access,invalid-name
+from __future__ import absolute_import, unicode_literals
+
+import json
+import logging
+import os
+
+from nose.tools import eq_
+
+from generate_cpp_makefile import (_get_build_plan, _get_compile_commands,
+                                   _makefile_chunks, _ninja_chunks)
+
+from pignacio_scripts.testing import TestCase
+
+from .utils import get_config
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+DEPENDENCIES = {
+    'src/a.cpp': [],
+    'src/b.cpp': [],
+    'src/c.cpp': [],
+}
+TARGETS = [
+    {'name': 'app', 'sources': ['a.cpp', 'b.cpp']},
+    {'name': 'lib', 'type': 'shared_library', 'sources': ['c.cpp']},
+]
+
+
+def _get_commands(**fields):
+    fields.setdefault('compiler_args', '-O2 -Iinc')
+    fields.setdefault('include_dirs', ['extra'])
+    fields.setdefault('targets', TARGETS)
+    config = get_config(**fields)
+    plan = _get_build_plan(config, DEPENDENCIES)
+    return dict((c['file'], c)
+                for c in json.loads(_get_compile_commands(config, plan)))
+
+
+class CompileCommandsTest(TestCase):
+    def test_entries(self):
+        commands = _get_commands()
+        eq_(sorted(commands), ['src/a.cpp', 'src/b.cpp', 'src/c.cpp'])
+        eq_(commands['src/a.cpp']['directory'], os.path.abspath(os.curdir))
+        eq_(commands['src/a.cpp']['output'], '.compiled/a.o')
+        eq_(commands['src/a.cpp']['arguments'],
+            ['g++', '-O2', '-Iinc', '-Iextra', '-c', '-o', '.compiled/a.o',
+             'src/a.cpp'])
+
+    def test_per_object_flags(self):
+        eq_(_get_commands()['src/c.cpp']['arguments'],
+            ['g++', '-O2', '-Iinc', '-fPIC', '-Iextra', '-c', '-o',
+             '.compiled/c.o', 'src/c.cpp'])
+
+    def test_precompiled_header_flags(self):
+        config = get_config(pch_headers=1)
+        dependencies = {'src/a.cpp': ['src/a.h'], 'src/b.cpp': ['src/a.h'],
+                        'src/a.h': []}
+        plan = _get_build_plan(config, dependencies)
+        commands = json.loads(_get_compile_commands(config, plan))
+        eq_(commands[0]['arguments'],
+            ['g++', '-include', '.compiled/pch.h', '-c', '-o',
+             '.compiled/a.o', 'src/a.cpp'])
+
+    def test_unity_sources_get_their_own_entry(self):
+        commands = _get_commands(unity_batch_size=2)
+        eq_(sorted(commands), ['src/a.cpp', 'src/b.cpp', 'src/c.cpp'])
+        for source in ('src/a.cpp', 'src/b.cpp'):
+            eq_(commands[source]['output'], '.compiled/unity/unity_0.o')
+            eq_(commands[source]['arguments'][-1], source)
+
+    def test_launcher_is_left_out(self):
+        commands = _get_commands(compiler_launcher='ccache')
+        eq_(commands['src/a.cpp']['arguments'][0], 'g++')
+        self.assertNotIn('ccache', commands['src/a.cpp']['arguments'])
+
+
+class CompilerLauncherTest(TestCase):
+    def _render(self, chunks_function, **fields):
+        config = get_config(**fields)
+        plan = _get_build_plan(config, DEPENDENCIES)
+        return "".join(chunks_function(config, plan, DEPENDENCIES,
+                                       timestamp=False))
+
+    def test_makefile(self):
+        makefile = self._render(_makefile_chunks,
+                                compiler_launcher='ccache')
+        self.assertIn('\nLAUNCHER := ccache\n', makefile)
+        self.assertIn('\t$(LAUNCHER) $(CC) $(CARGS)', makefile)
+
+    def test_makefile_without_launcher(self):
+        makefile = self._render(_makefile_chunks)
+        self.assertNotIn('LAUNCHER', makefile)
+
+    def test_makefile_with_compile_timer(self):
+        config = get_config(compiler_launcher='ccache')
+        plan = _get_build_plan(config, DEPENDENCIES, record_times=True)
+        makefile = "".join(_makefile_chunks(config, plan, DEPENDENCIES,
+                                            timestamp=False))
+        self.assertIn('\t$(TIMER) "$@" $(LAUNCHER) $(CC) $(CARGS)',
+                      makefile)
+
+    def test_ninja(self):
+        ninja = self._render(_ninja_chunks, compiler_launcher='sccache')
+        self.assertIn('\nlauncher = sccache\n', ninja)
+        self.assertIn('  command = $launcher $cc $cargs', ninja)
+        # Only compiles are launched through it
+        self.assertIn('rule link\n  command = $cc $cargs', ninja)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=protected-access,invalid-name
+from __future__ import absolute_import, unicode_literals
+
+import collections
+import io
+import logging
+
+from nose.tools import eq_
+
+from generate_cpp_makefile import (NINJA_LOG, _generate, _get_arg_parser,
+                                   _order_by_compile_time)
+
+from pignacio_scripts.testing import TestCase
+
+from .utils import TreeTestCase
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+CONFIG = '''\
+compiler: g++
+source_dir: src
+program: prog
+'''
+
+
+def _order(compile_times):
+    objects = [(name + '.cpp', name + '.o', []) for name in 'abc']
+    target_objects = collections.OrderedDict(
+        [('prog', [o for _path, o, _deps in objects])])
+    objects, target_objects = _order_by_compile_time(objects, target_objects,
+                                                     compile_times)
+    eq_([o for _path, o, _deps in objects], target_objects['prog'])
+    return target_objects['prog']
+
+
+class OrderByCompileTimeTest(TestCase):
+    def test_slowest_first(self):
+        eq_(_order({'a.o': 1, 'b.o': 10, 'c.o': 3}), ['b.o', 'c.o', 'a.o'])
+
+    def test_no_times(self):
+        eq_(_order({}), ['a.o', 'b.o', 'c.o'])
+
+    def test_missing_times_are_average(self):
+        eq_(_order({'a.o': 1, 'b.o': 10}), ['b.o', 'c.o', 'a.o'])
+
+    def test_noise_does_not_reorder(self):
+        eq_(_order({'a.o': 2.05, 'b.o': 2.0, 'c.o': 2.1}),
+            ['a.o', 'b.o', 'c.o'])
+        eq_(_order({'a.o': 0.01, 'b.o': 0.05, 'c.o': 0.03}),
+            ['a.o', 'b.o', 'c.o'])
+
+
+class NinjaCompileTimesTest(TreeTestCase):
+    def setUp(self):
+        super(NinjaCompileTimesTest, self).setUp()
+        self.write_tree({
+            '.makefilegenerator.config': CONFIG,
+            'src/a.cpp': '',
+            'src/b.cpp': '',
+            NINJA_LOG: ('# ninja log v5\n'
+                        '0\t100\t0\t.compiled/a.o\t0\n'
+                        '0\t5000\t0\t.compiled/b.o\t0\n'),
+        })
+
+    @staticmethod
+    def _get_compile_order(*args):
+        _generate(_get_arg_parser().parse_args(
+            ['--backend', 'ninja', '--no-timestamp'] + list(args)))
+        with io.open('build.ninja', encoding='utf-8') as fin:
+            return [line.split()[1].rstrip(':') for line in fin
+                    if line.startswith('build ') and ' cc ' in line]
+
+    def test_ninja_log_is_ignored_by_default(self):
+        eq_(self._get_compile_order(), ['.compiled/a.o', '.compiled/b.o'])
+
+    def test_ninja_log_is_used_with_record_times(self):
+        eq_(self._get_compile_order('--record-times'),
+            ['.compiled/b.o', '.compiled/a.o'])
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=protected-access,invalid-name
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import os
+
+from nose.tools import eq_
+import yaml
+
+from generate_cpp_makefile import MakefileGeneratorConfig
+
+from .utils import TreeTestCase
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+CONFIG_FILE = 'makefilegenerator.config'
+CONFIG = '''\
+compiler: g++
+source_dir: src
+program: prog
+'''
+
+
+class LoadConfigTest(TreeTestCase):
+    def setUp(self):
+        super(LoadConfigTest, self).setUp()
+        self.write_tree({CONFIG_FILE: CONFIG})
+
+    def test_config_is_loaded(self):
+        config = MakefileGeneratorConfig.from_file(CONFIG_FILE)
+        eq_(config.compiler, 'g++')
+        eq_(config.source_dir, 'src')
+        eq_([t.name for t in config.targets], ['prog'])
+
+    def test_nothing_is_written(self):
+        MakefileGeneratorConfig.from_file(CONFIG_FILE)
+        eq_(os.listdir('.'), [CONFIG_FILE])
+
+    def test_unsafe_tags_are_rejected(self):
+        self.write_tree({CONFIG_FILE: CONFIG + 'libs: !!python/object/apply:'
+                         'os.getcwd []\n'})
+        self.assertRaises(yaml.YAMLError, MakefileGeneratorConfig.from_file,
+                          CONFIG_FILE)
+
+
+class ValidateConfigTest(TreeTestCase):
+    def test_all_errors_are_reported(self):
+        self.write_tree({CONFIG_FILE: 'compiler: 3\nlibs: m\n'})
+        with self.assertRaises(ValueError) as context:
+            MakefileGeneratorConfig.from_file(CONFIG_FILE)
+        message = str(context.exception)
+        self.assertIn("Field 'compiler' should be a str", message)
+        self.assertIn("Field 'libs' should be a list", message)
+        self.assertIn("Sources dir field 'source_dir' is missing", message)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=protected-access,invalid-name
+from __future__ import absolute_import, unicode_literals
+
+import logging
+
+from nose.tools import eq_
+
+from generate_cpp_makefile import DependencyGraph
+
+from pignacio_scripts.testing import TestCase
+
+from .utils import TreeTestCase, get_config
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# main.cpp -> a.h -> b.h <-> c.h, util.cpp -> c.h, other.cpp -> other.h
+DEPENDENCIES = {
+    'src/main.cpp': ['src/a.h'],
+    'src/util.cpp': ['src/c.h'],
+    'src/other.cpp': ['src/other.h'],
+    'src/a.h': ['src/b.h'],
+    'src/b.h': ['src/c.h'],
+    'src/c.h': ['src/b.h'],
+    'src/other.h': [],
+}
+
+
+class DependencyGraphQueryTest(TestCase):
+    def setUp(self):
+        self.graph = DependencyGraph(DEPENDENCIES)
+
+    def test_includes_of(self):
+        eq_(self.graph.includes_of('src/main.cpp'), ['src/a.h'])
+        eq_(self.graph.includes_of('src/main.cpp', transitive=True),
+            ['src/a.h', 'src/b.h', 'src/c.h'])
+
+    def test_includes_of_cycle_member(self):
+        eq_(self.graph.includes_of('src/b.h', transitive=True),
+            ['src/c.h'])
+
+    def test_reverse_deps(self):
+        eq_(self.graph.reverse_deps('src/a.h', transitive=False),
+            ['src/main.cpp'])
+        eq_(self.graph.reverse_deps('src/c.h'),
+            ['src/a.h', 'src/b.h', 'src/main.cpp', 'src/util.cpp'])
+
+    def test_paths_are_normalized(self):
+        eq_(self.graph.reverse_deps('./src/a.h'), ['src/main.cpp'])
+        eq_(self.graph.includes_of('src/../src/main.cpp'), ['src/a.h'])
+
+    def test_unknown_file(self):
+        eq_(self.graph.includes_of('src/missing.h'), [])
+        eq_(self.graph.reverse_deps('src/missing.h'), [])
+        eq_(self.graph.affected_sources(['src/missing.h']), [])
+
+    def test_affected_sources(self):
+        eq_(self.graph.affected_sources(['src/a.h']), ['src/main.cpp'])
+        eq_(self.graph.affected_sources(['src/b.h']),
+            ['src/main.cpp', 'src/util.cpp'])
+        eq_(self.graph.affected_sources(['src/other.cpp', 'src/a.h']),
+            ['src/main.cpp', 'src/other.cpp'])
+
+    def test_affected_objects_needs_config(self):
+        self.assertRaises(ValueError, self.graph.affected_objects,
+                          ['src/a.h'])
+
+
+class DependencyGraphObjectsTest(TestCase):
+    def test_affected_objects(self):
+        graph = DependencyGraph(DEPENDENCIES, get_config())
+        eq_(graph.affected_objects(['src/a.h']), ['.compiled/main.o'])
+        eq_(graph.affected_objects(['src/c.h']),
+            ['.compiled/main.o', '.compiled/util.o'])
+        eq_(graph.affected_objects(['src/other.cpp']), ['.compiled/other.o'])
+
+    def test_precompiled_header_affects_every_object(self):
+        graph = DependencyGraph(DEPENDENCIES, get_config(pch_headers=1))
+        all_objects = ['.compiled/main.o', '.compiled/other.o',
+                       '.compiled/util.o']
+        # b.h and c.h are used by two sources, and precompiled
+        eq_(graph.affected_objects(['src/c.h']), all_objects)
+        eq_(graph.affected_objects(['src/other.h']), ['.compiled/other.o'])
+
+    def test_unity_objects(self):
+        graph = DependencyGraph(DEPENDENCIES,
+                                get_config(unity_batch_size=2,
+                                            unity_exclude=['other.cpp']))
+        eq_(graph.affected_objects(['src/a.h']),
+            ['.compiled/unity/unity_0.o'])
+        eq_(graph.affected_objects(['src/util.cpp']),
+            ['.compiled/unity/unity_0.o'])
+        eq_(graph.affected_objects(['src/other.h']), ['.compiled/other.o'])
+
+
+class DependencyGraphFromConfigTest(TreeTestCase):
+    def test_from_config(self):
+        self.write_tree({
+            'src/main.cpp': '#include "a.h"\n',
+            'src/a.h': '#include "b.h"\n',
+            'src/b.h': '#include "a.h"\n',
+        })
+        graph = DependencyGraph.from_config(get_config())
+        eq_(graph.includes_of('src/main.cpp', transitive=True),
+            ['src/a.h', 'src/b.h'])
+        eq_(graph.affected_objects(['src/b.h']), ['.compiled/main.o'])
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=protected-access,invalid-name
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import os
+
+from nose.tools import eq_
+
+from generate_cpp_makefile import FileIndex, SourceTree
+
+from .utils import TreeTestCase
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class FileIndexResolveTest(TreeTestCase):
+    def test_quoted_include_is_relative_to_parent(self):
+        index = FileIndex(set(['a/main.cpp', 'a/b.h']))
+        eq_(index.resolve('a/main.cpp', 'b.h'), 'a/b.h')
+
+    def test_relative_include_is_normalized(self):
+        index = FileIndex(set(['a/main.cpp', 'b/c.h']))
+        eq_(index.resolve('a/main.cpp', '../b/c.h'), 'b/c.h')
+
+    def test_missing_include(self):
+        index = FileIndex(set(['a/main.cpp']))
+        self.assertIsNone(index.resolve('a/main.cpp', 'b.h'))
+
+    def test_system_include_is_not_relative_to_parent(self):
+        index = FileIndex(set(['a/main.cpp', 'a/b.h']))
+        self.assertIsNone(index.resolve('a/main.cpp', '<b.h>'))
+
+    def test_walked_paths_are_normalized(self):
+        self.write_tree({'a/main.cpp': '', 'a/b.h': ''})
+        index = FileIndex.from_dirs(['.'])
+        eq_(index.files, set(['a/main.cpp', 'a/b.h']))
+        eq_(index.resolve('a/main.cpp', 'b.h'), 'a/b.h')
+
+    def test_added_and_discarded_paths_are_normalized(self):
+        index = FileIndex(set(['a/main.cpp']))
+        index.add('./a/b.h')
+        eq_(index.resolve('a/main.cpp', 'b.h'), 'a/b.h')
+        index.discard('./a/b.h')
+        self.assertIsNone(index.resolve('a/main.cpp', 'b.h'))
+
+
+class SourceTreeTest(TreeTestCase):
+    def setUp(self):
+        super(SourceTreeTest, self).setUp()
+        self.write_tree({
+            'a/main.cpp': '#include "b.h"\nint main() {}\n',
+            'a/b.h': '#include "../c/d.h"\n',
+            'c/d.h': '',
+        })
+
+    def test_dependencies(self):
+        tree = SourceTree('.')
+        tree.scan()
+        eq_(dict(tree.dependencies), {
+            'a/main.cpp': ['a/b.h'],
+            'a/b.h': ['c/d.h'],
+            'c/d.h': [],
+        })
+
+    def test_source_dir_with_dot_prefix(self):
+        self.write_tree({'src/main.cpp': '#include "x.h"\n', 'src/x.h': ''})
+        tree = SourceTree('./src/')
+        tree.scan()
+        eq_(tree.dependencies['src/main.cpp'], ['src/x.h'])
+
+    def test_update_with_unnormalized_paths(self):
+        tree = SourceTree('.')
+        tree.scan()
+        self.write_tree({'a/e.h': '', 'a/main.cpp': '#include "e.h"\n'})
+        self.assertTrue(tree.update(['./a/e.h', './a/main.cpp']))
+        eq_(tree.dependencies['a/main.cpp'], ['a/e.h'])
+        self.assertNotIn('./a/main.cpp', tree.dependencies)
+
+    def _check_new_directory(self, changed_paths):
+        tree = SourceTree('.')
+        tree.scan()
+        self.write_tree({'a/new/f.h': '',
+                         'a/main.cpp': '#include "new/f.h"\n'})
+        self.assertTrue(tree.update(changed_paths))
+        eq_(tree.dependencies['a/main.cpp'], ['a/new/f.h'])
+
+    def test_update_with_new_directory_first(self):
+        self._check_new_directory(['a/new', 'a/new/f.h', 'a/main.cpp'])
+
+    def test_update_with_new_directory_last(self):
+        self._check_new_directory(['a/new/f.h', 'a/main.cpp', 'a/new'])
+
+    def test_update_with_deleted_directory(self):
+        tree = SourceTree('.')
+        tree.scan()
+        os.remove('c/d.h')
+        os.rmdir('c')
+        self.assertTrue(tree.update(['c']))
+        eq_(tree.dependencies['a/b.h'], [])
+        self.assertNotIn('c/d.h', tree.file_index.files)
+
+
+class FileIndexSearchTest(TreeTestCase):
+    def setUp(self):
+        super(FileIndexSearchTest, self).setUp()
+        self.files = set(['src/main.cpp', 'first/x.h', 'second/x.h',
+                          'second/sub/y.h', 'first/other/sub/y.h'])
+
+    def test_first_include_dir_wins(self):
+        index = FileIndex(self.files, ['first', 'second'])
+        eq_(index.search('x.h'), 'first/x.h')
+        index = FileIndex(self.files, ['second', 'first'])
+        eq_(index.search('x.h'), 'second/x.h')
+
+    def test_include_with_subdirectory(self):
+        index = FileIndex(self.files, ['first', 'second'])
+        eq_(index.search('sub/y.h'), 'second/sub/y.h')
+
+    def test_only_include_dirs_are_searched(self):
+        index = FileIndex(self.files, ['second'])
+        eq_(index.search('x.h'), 'second/x.h')
+        index = FileIndex(self.files, ['first/other'])
+        self.assertIsNone(index.search('x.h'))
+
+    def test_parent_dir_is_searched_before_include_dirs(self):
+        self.files.add('src/x.h')
+        index = FileIndex(self.files, ['first'])
+        eq_(index.resolve('src/main.cpp', 'x.h'), 'src/x.h')
+        eq_(index.resolve('src/main.cpp', '<x.h>'), 'first/x.h')
+
+    def test_current_dir_as_include_dir(self):
+        index = FileIndex(self.files, ['.'])
+        eq_(index.search('first/x.h'), 'first/x.h')
+        self.assertIsNone(index.search('x.h'))
+
+    def test_lookup_matches_filesystem_probe(self):
+        self.write_tree(dict((path, '') for path in self.files))
+        for include_dirs in (['first', 'second'], ['second', 'first'],
+                             ['first/other', '.']):
+            index = FileIndex(set(self.files), include_dirs)
+            probe = FileIndex.from_filesystem(include_dirs)
+            for include in ('x.h', 'sub/y.h', 'first/x.h', 'z.h'):
+                eq_(index.search(include), probe.search(include))
+
+    def test_results_are_reset_on_changes(self):
+        index = FileIndex(self.files, ['first', 'second'])
+        eq_(index.search('x.h'), 'first/x.h')
+        index.discard('first/x.h')
+        eq_(index.search('x.h'), 'second/x.h')
+        index.add('first/x.h')
+        eq_(index.search('x.h'), 'first/x.h')
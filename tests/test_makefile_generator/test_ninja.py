@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=protected-access,invalid-name
+from __future__ import absolute_import, unicode_literals
+
+import logging
+
+from nose.tools import eq_
+
+from generate_cpp_makefile import (_get_build_plan, _ninja_chunks,
+                                   _ninja_escape)
+
+from pignacio_scripts.testing import TestCase
+
+from .utils import get_config
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+DEPENDENCIES = {
+    'src/main.cpp': ['src/a.h'],
+    'src/util.cpp': ['src/a.h'],
+    'src/odd name.cpp': [],
+    'src/a.h': [],
+}
+TARGETS = [
+    {'name': 'app', 'sources': ['main.cpp'], 'link': ['util'],
+     'libs': ['pthread']},
+    {'name': 'util', 'type': 'shared_library',
+     'sources': ['util.cpp', 'odd name.cpp']},
+    {'name': 'core', 'type': 'static_library', 'sources': ['util.cpp']},
+]
+
+
+def _render(**fields):
+    fields.setdefault('targets', TARGETS)
+    config = get_config(**fields)
+    plan = _get_build_plan(config, DEPENDENCIES)
+    return "".join(_ninja_chunks(config, plan, DEPENDENCIES,
+                                 timestamp=False))
+
+
+def _get_edge(ninja, output):
+    """ The build line of ``output`` and its indented variables. """
+    lines = ninja.splitlines()
+    start = next(i for i, line in enumerate(lines)
+                 if line.startswith('build {}:'.format(output)))
+    end = start + 1
+    while end < len(lines) and lines[end].startswith('  '):
+        end += 1
+    return lines[start:end]
+
+
+class NinjaEscapeTest(TestCase):
+    def test_escape(self):
+        eq_(_ninja_escape('a b:c$d'), 'a$ b$:c$$d')
+
+
+class NinjaBackendTest(TestCase):
+    def test_compile_rule_uses_gcc_deps(self):
+        ninja = _render()
+        rule = ninja[ninja.index('rule cc\n'):ninja.index('rule pch\n')]
+        self.assertIn('  depfile = $out.d\n', rule)
+        self.assertIn('  deps = gcc\n', rule)
+        self.assertIn('-MMD -MF $out.d', rule)
+
+    def test_includes_are_implicit_deps(self):
+        eq_(_get_edge(_render(), '.compiled/main.o'),
+            ['build .compiled/main.o: cc src/main.cpp | src/a.h'])
+
+    def test_shared_library_objects_are_pic(self):
+        eq_(_get_edge(_render(), '.compiled/util.o'),
+            ['build .compiled/util.o: cc src/util.cpp | src/a.h',
+             '  cargs = $cargs -fPIC'])
+
+    def test_objects_are_compiled_once(self):
+        eq_(_render().count('build .compiled/util.o:'), 1)
+
+    def test_precompiled_header(self):
+        ninja = _render(pch_headers=1)
+        eq_(_get_edge(ninja, '.compiled/pch.h.gch'),
+            ['build .compiled/pch.h.gch: pch .compiled/pch.h | src/a.h'])
+        eq_(_get_edge(ninja, '.compiled/main.o'),
+            ['build .compiled/main.o: cc src/main.cpp | src/a.h '
+             '.compiled/pch.h.gch',
+             '  cargs = $cargs -include .compiled/pch.h'])
+
+    def test_paths_are_escaped(self):
+        eq_(_get_edge(_render(), '.compiled/odd$ name.o'),
+            ['build .compiled/odd$ name.o: cc src/odd$ name.cpp',
+             '  cargs = $cargs -fPIC'])
+
+    def test_link_edges(self):
+        ninja = _render()
+        eq_(_get_edge(ninja, 'app'),
+            ['build app: link .compiled/main.o libutil.so',
+             '  libs = $libs -lpthread'])
+        eq_(_get_edge(ninja, 'libutil.so'),
+            ['build libutil.so: link_shared .compiled/odd$ name.o '
+             '.compiled/util.o'])
+        eq_(_get_edge(ninja, 'libcore.a'),
+            ['build libcore.a: archive .compiled/util.o'])
+        self.assertIn('\ndefault app libutil.so libcore.a\n', ninja)
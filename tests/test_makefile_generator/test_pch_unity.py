@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=protected-access,invalid-name
+from __future__ import absolute_import, unicode_literals
+
+import io
+import logging
+import os
+
+from nose.tools import eq_
+
+from generate_cpp_makefile import (_get_build_plan,
+                                   _get_most_included_headers,
+                                   _transitive_closure,
+                                   _write_generated_files)
+
+from pignacio_scripts.testing import TestCase
+
+from .utils import TreeTestCase, get_config
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# common.h is used by 3 sources (one of them through a.h), a.h by 2 and
+# only.h by 1
+DEPENDENCIES = {
+    'src/a.cpp': ['src/a.h'],
+    'src/b.cpp': ['src/a.h', 'src/only.h'],
+    'src/c.cpp': ['src/common.h'],
+    'src/a.h': ['src/common.h'],
+    'src/common.h': [],
+    'src/only.h': [],
+}
+
+
+class MostIncludedHeadersTest(TestCase):
+    def setUp(self):
+        self.closures = _transitive_closure(DEPENDENCIES)
+        self.sources = ['src/a.cpp', 'src/b.cpp', 'src/c.cpp']
+
+    def test_most_used_first(self):
+        eq_(_get_most_included_headers(self.closures, self.sources, 1),
+            ['src/common.h'])
+        eq_(_get_most_included_headers(self.closures, self.sources, 2),
+            ['src/common.h', 'src/a.h'])
+
+    def test_headers_used_once_are_left_out(self):
+        eq_(_get_most_included_headers(self.closures, self.sources, 10),
+            ['src/common.h', 'src/a.h'])
+
+
+class PrecompiledHeaderTest(TestCase):
+    def test_precompiled_header(self):
+        plan = _get_build_plan(get_config(pch_headers=1), DEPENDENCIES)
+        eq_(plan.pch, '.compiled/pch.h')
+        eq_(plan.pch_deps, ['src/common.h'])
+        eq_(plan.generated['.compiled/pch.h'].splitlines()[1:],
+            ['#include "../src/common.h"'])
+
+    def test_pch_deps_include_the_headers_dependencies(self):
+        plan = _get_build_plan(get_config(pch_headers=2), DEPENDENCIES)
+        eq_(plan.pch_deps, ['src/a.h', 'src/common.h'])
+
+    def test_no_header_worth_precompiling(self):
+        plan = _get_build_plan(get_config(pch_headers=1),
+                               {'src/a.cpp': ['src/only.h'],
+                                'src/only.h': []})
+        self.assertIsNone(plan.pch)
+        eq_(plan.generated, {})
+
+
+def _get_batches(dependencies, **fields):
+    fields.setdefault('unity_batch_size', 2)
+    plan = _get_build_plan(get_config(**fields), dependencies)
+    return plan, sorted(plan.batches.values())
+
+
+class UnityBuildTest(TestCase):
+    def test_sources_are_batched(self):
+        plan, batches = _get_batches(DEPENDENCIES)
+        eq_(batches, [['src/a.cpp', 'src/b.cpp']])
+        eq_(sorted(o for _path, o, _deps in plan.objects),
+            ['.compiled/c.o', '.compiled/unity/unity_0.o'])
+        eq_(plan.generated['.compiled/unity/unity_0.cpp'].splitlines()[1:],
+            ['#include "../../src/a.cpp"', '#include "../../src/b.cpp"'])
+
+    def test_batch_depends_on_its_sources_dependencies(self):
+        plan, _batches = _get_batches(DEPENDENCIES)
+        eq_(dict((o, deps) for _path, o, deps in plan.objects)[
+            '.compiled/unity/unity_0.o'],
+            ['src/a.cpp', 'src/a.h', 'src/b.cpp', 'src/only.h'])
+
+    def test_single_source_batches_are_left_alone(self):
+        _plan, batches = _get_batches(DEPENDENCIES, unity_batch_size=3)
+        eq_(batches, [['src/a.cpp', 'src/b.cpp', 'src/c.cpp']])
+        plan, batches = _get_batches({'src/a.cpp': []})
+        eq_(batches, [])
+        eq_([o for _path, o, _deps in plan.objects], ['.compiled/a.o'])
+
+    def test_excluded_sources(self):
+        _plan, batches = _get_batches(DEPENDENCIES,
+                                      unity_exclude=['a.cpp'])
+        eq_(batches, [['src/b.cpp', 'src/c.cpp']])
+
+    def test_sources_are_grouped_by_extension(self):
+        _plan, batches = _get_batches({
+            'src/a.c': [], 'src/b.cpp': [], 'src/c.c': [], 'src/d.cpp': [],
+        })
+        eq_(batches, [['src/a.c', 'src/c.c'], ['src/b.cpp', 'src/d.cpp']])
+
+    def test_sources_are_grouped_by_targets_and_pic(self):
+        dependencies = dict(('src/{}.cpp'.format(n), []) for n in 'abcdef')
+        plan, batches = _get_batches(dependencies, targets=[
+            {'name': 'app', 'sources': ['a.cpp', 'b.cpp', 'e.cpp']},
+            {'name': 'tool', 'sources': ['c.cpp', 'd.cpp', 'e.cpp']},
+            {'name': 'lib', 'type': 'shared_library',
+             'sources': ['f.cpp', 'e.cpp']},
+        ])
+        eq_(batches, [['src/a.cpp', 'src/b.cpp'], ['src/c.cpp', 'src/d.cpp']])
+        # e.cpp is the only source of app, tool and lib, f.cpp the only
+        # one of lib
+        app_object = next(os.path.splitext(unity_source)[0] + '.o'
+                          for unity_source, sources in plan.batches.items()
+                          if 'src/a.cpp' in sources)
+        eq_(plan.target_objects['app'],
+            sorted([app_object, '.compiled/e.o']))
+        eq_(plan.pic_objects, set(['.compiled/e.o', '.compiled/f.o']))
+
+
+class WriteGeneratedFilesTest(TreeTestCase):
+    def test_stale_unity_sources_are_removed(self):
+        config = get_config(unity_batch_size=2)
+        _write_generated_files(config, _get_build_plan(config, DEPENDENCIES))
+        unity_dir = os.path.join('.compiled', 'unity')
+        eq_(os.listdir(unity_dir), ['unity_0.cpp'])
+        self.write_tree({os.path.join(unity_dir, 'unity_5.cpp'): '',
+                         os.path.join(unity_dir, 'unity_0.o'): ''})
+        _write_generated_files(config, _get_build_plan(config, DEPENDENCIES))
+        eq_(sorted(os.listdir(unity_dir)), ['unity_0.cpp', 'unity_0.o'])
+
+    def test_unchanged_sources_are_not_rewritten(self):
+        config = get_config(unity_batch_size=2)
+        plan = _get_build_plan(config, DEPENDENCIES)
+        _write_generated_files(config, plan)
+        path = os.path.join('.compiled', 'unity', 'unity_0.cpp')
+        os.utime(path, (1, 1))
+        _write_generated_files(config, plan)
+        eq_(os.path.getmtime(path), 1)
+        with io.open(path, encoding='utf-8') as fin:
+            eq_(fin.read(), plan.generated[path])
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=protected-access,invalid-name
+from __future__ import absolute_import, unicode_literals
+
+import json
+import logging
+import os
+
+from nose.tools import eq_
+
+from generate_cpp_makefile import ScanCache, SourceTree
+
+from .utils import TreeTestCase
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+CACHE_FILE = '.compiled/cache'
+
+
+class ScanCacheTest(TreeTestCase):
+    def setUp(self):
+        super(ScanCacheTest, self).setUp()
+        self.write_tree({'a.h': '#include "b.h"\n', 'b.h': ''})
+        cache = ScanCache.load(CACHE_FILE, scan_mode='full')
+        self.assertIsNone(cache.lookup('a.h'))
+        cache.store('a.h', ['b.h'])
+        cache.save()
+
+    def _load(self, **kwargs):
+        kwargs.setdefault('scan_mode', 'full')
+        return ScanCache.load(CACHE_FILE, **kwargs)
+
+    def test_unchanged_file_is_a_hit(self):
+        cache = self._load()
+        eq_(cache.lookup('a.h'), ['b.h'])
+        eq_((cache.hits, cache.misses), (1, 0))
+
+    def test_changed_file_is_a_miss(self):
+        self.write_tree({'a.h': '#include "other.h"\n'})
+        cache = self._load()
+        self.assertIsNone(cache.lookup('a.h'))
+        eq_((cache.hits, cache.misses), (0, 1))
+
+    def test_touched_file_is_a_miss(self):
+        os.utime('a.h', (1, 1))
+        self.assertIsNone(self._load().lookup('a.h'))
+
+    def test_touched_file_with_same_hash_is_a_hit(self):
+        self.write_tree({'a.h': '#include "b.h"\n// hashed\n'})
+        cache = self._load(use_hash=True)
+        self.assertIsNone(cache.lookup('a.h'))
+        cache.store('a.h', ['b.h'])
+        cache.save()
+        os.utime('a.h', (1, 1))
+        cache = self._load(use_hash=True)
+        eq_(cache.lookup('a.h'), ['b.h'])
+        # The new mtime is stored, so the file isn't hashed again
+        cache.save()
+        eq_(self._load().lookup('a.h'), ['b.h'])
+
+    def test_new_file_is_a_miss(self):
+        self.write_tree({'c.h': ''})
+        self.assertIsNone(self._load().lookup('c.h'))
+
+    def test_unused_entries_are_dropped(self):
+        self._load().save()
+        self.assertIsNone(self._load().lookup('a.h'))
+
+    def test_forgotten_entries_are_dropped(self):
+        cache = self._load()
+        cache.lookup('a.h')
+        cache.forget('a.h')
+        cache.save()
+        self.assertIsNone(self._load().lookup('a.h'))
+
+    def test_other_scan_mode_is_ignored(self):
+        self.assertIsNone(self._load(scan_mode='stop_at_code').lookup('a.h'))
+
+    def test_other_version_is_ignored(self):
+        with open(CACHE_FILE) as fin:
+            data = json.load(fin)
+        data['version'] = -1
+        with open(CACHE_FILE, 'w') as fout:
+            json.dump(data, fout)
+        self.assertIsNone(self._load().lookup('a.h'))
+
+    def test_corrupt_cache_is_ignored(self):
+        with open(CACHE_FILE, 'w') as fout:
+            fout.write('{')
+        self.assertIsNone(self._load().lookup('a.h'))
+
+
+class SourceTreeCacheTest(TreeTestCase):
+    def setUp(self):
+        super(SourceTreeCacheTest, self).setUp()
+        self.write_tree({
+            'src/main.cpp': '#include "a.h"\n#include "b.h"\n',
+            'src/a.h': '',
+        })
+        self._scan()
+
+    def _scan(self):
+        cache = ScanCache.load(CACHE_FILE, scan_mode='full')
+        tree = SourceTree('src')
+        tree.scan(cache)
+        cache.save()
+        return tree, cache
+
+    def test_unchanged_tree_is_not_scanned(self):
+        tree, cache = self._scan()
+        eq_((cache.hits, cache.misses), (2, 0))
+        eq_(tree.dependencies['src/main.cpp'], ['src/a.h'])
+
+    def test_added_file_is_resolved(self):
+        self.write_tree({'src/b.h': ''})
+        tree, cache = self._scan()
+        eq_((cache.hits, cache.misses), (2, 1))
+        eq_(tree.dependencies['src/main.cpp'], ['src/a.h', 'src/b.h'])
+
+    def test_deleted_file_is_not_resolved(self):
+        os.remove('src/a.h')
+        tree, cache = self._scan()
+        eq_((cache.hits, cache.misses), (1, 0))
+        eq_(tree.dependencies['src/main.cpp'], [])
+
+    def test_changed_file_is_rescanned(self):
+        self.write_tree({'src/main.cpp': '#include "a.h"\n// changed\n'})
+        tree, cache = self._scan()
+        eq_((cache.hits, cache.misses), (1, 1))
+        eq_(tree.dependencies['src/main.cpp'], ['src/a.h'])
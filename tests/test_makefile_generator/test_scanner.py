@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=protected-access,invalid-name
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import os
+
+from nose.tools import eq_
+
+from generate_cpp_makefile import (_check_scanner, _get_includes,
+                                   _get_includes_by_line, _scan_file,
+                                   _scan_files)
+
+from pignacio_scripts.testing import TestCase
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'scanner_corpus')
+
+
+def _corpus_file(fname):
+    return os.path.join(CORPUS_DIR, fname)
+
+
+class ScannerCorpusTest(TestCase):
+    def test_scanner_matches_reference(self):
+        for fname in sorted(os.listdir(CORPUS_DIR)):
+            path = _corpus_file(fname)
+            eq_(_get_includes(path), list(_get_includes_by_line(path)),
+                fname)
+
+    def test_commented_includes_are_skipped(self):
+        eq_(_get_includes(_corpus_file('comments.cpp')), ['a.h', '<vector>'])
+
+    def test_includes_without_space(self):
+        eq_(_get_includes(_corpus_file('no_space.cpp')),
+            ['<vector>', 'a.h', 'indented.h'])
+
+    def test_non_utf8_bytes(self):
+        eq_(_get_includes(_corpus_file('latin1.h')), ['caf\ufffd.h', 'a.h'])
+
+    def test_crlf_line_endings(self):
+        eq_(_get_includes(_corpus_file('crlf.h')), ['a.h', '<map>'])
+
+    def test_stop_at_code_misses_includes_after_code(self):
+        path = _corpus_file('after_code.cpp')
+        eq_(_get_includes(path), ['a.h', 'after_code.h', 'in_if.h'])
+        eq_(_get_includes(path, stop_at_code=True), ['a.h'])
+
+    def test_check_scanner(self):
+        eq_(_check_scanner(CORPUS_DIR), 0)
+        eq_(_check_scanner(CORPUS_DIR, stop_at_code=True), 1)
+
+    def test_scan_file_counts_every_byte_read(self):
+        path = _corpus_file('after_code.cpp')
+        size = os.path.getsize(path)
+        eq_(_scan_file(path), (['a.h', 'after_code.h', 'in_if.h'], size))
+        eq_(_scan_file(path, stop_at_code=True), (['a.h'], size))
+
+
+class ScanFilesTest(TestCase):
+    def setUp(self):
+        # More files than processes, so each process gets several chunks
+        self.paths = sorted(_corpus_file(f)
+                            for f in os.listdir(CORPUS_DIR)) * 3
+
+    def test_parallel_scan_matches_serial_scan(self):
+        serial = _scan_files(self.paths)
+        eq_([path for path, _includes, _size in serial], self.paths)
+        eq_(_scan_files(self.paths, jobs=2), serial)
+
+    def test_one_process_per_cpu(self):
+        eq_(_scan_files(self.paths, jobs=0), _scan_files(self.paths))
+
+    def test_no_files(self):
+        eq_(_scan_files([], jobs=2), [])
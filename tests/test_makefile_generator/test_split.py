@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=protected-access,invalid-name
+from __future__ import absolute_import, unicode_literals
+
+import io
+import logging
+import os
+
+from nose.tools import eq_
+
+from generate_cpp_makefile import (_generate, _get_arg_parser,
+                                   _get_fragment_key)
+
+from pignacio_scripts.testing import TestCase
+
+from .utils import TreeTestCase
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+CONFIG = '''\
+compiler: g++
+source_dir: {}
+include_dirs: [{}]
+program: prog
+'''
+
+
+def _find_fragments(root):
+    return sorted(os.path.relpath(os.path.join(path, fname), root)
+                  for path, _subdirs, fnames in os.walk(root)
+                  for fname in fnames if fname == 'rules.mk')
+
+
+class FragmentKeyTest(TestCase):
+    def test_relative_dir(self):
+        eq_(_get_fragment_key('src/a'), 'src/a')
+
+    def test_current_dir(self):
+        eq_(_get_fragment_key(''), '.')
+        eq_(_get_fragment_key('.'), '.')
+
+    def test_absolute_dir(self):
+        eq_(_get_fragment_key('/usr/include'), '__root__/usr/include')
+
+    def test_parent_dir(self):
+        eq_(_get_fragment_key('../lib'), '__parent__/lib')
+        eq_(_get_fragment_key('a/../../lib'), '__parent__/lib')
+
+
+class SplitMakefileTest(TreeTestCase):
+    def setUp(self):
+        super(SplitMakefileTest, self).setUp()
+        self.write_tree({
+            'proj/main.cpp': '#include "a/a.h"\n#include "lib.h"\n',
+            'proj/a/a.h': '',
+            'lib/lib.h': '',
+        })
+        os.chdir('proj')
+
+    def _generate(self, source_dir, include_dir, extra_config=''):
+        self.write_tree({'.makefilegenerator.config':
+                         CONFIG.format(source_dir, include_dir) +
+                         extra_config})
+        _generate(_get_arg_parser().parse_args(['--split']))
+
+    def test_relative_dirs(self):
+        self._generate('.', '../lib')
+        eq_(_find_fragments(self.root), [
+            'proj/.compiled/makefiles/__parent__/lib/rules.mk',
+            'proj/.compiled/makefiles/a/rules.mk',
+            'proj/.compiled/makefiles/rules.mk',
+        ])
+
+    def test_absolute_dirs(self):
+        self._generate(os.path.abspath('.'), os.path.abspath('../lib'))
+        fragments = _find_fragments(self.root)
+        eq_(len(fragments), 3)
+        for fragment in fragments:
+            self.assertTrue(fragment.startswith(
+                'proj/.compiled/makefiles/__root__/'), fragment)
+
+    def test_fragments_are_included(self):
+        self._generate('.', '../lib')
+        with io.open('makefile', encoding='utf-8') as fin:
+            includes = [line.split()[1] for line in fin
+                        if line.startswith('include ')]
+        eq_(includes, [
+            '.compiled/makefiles/__parent__/lib/rules.mk',
+            '.compiled/makefiles/a/rules.mk',
+            '.compiled/makefiles/rules.mk',
+        ])
+
+    def test_gone_fragments_are_deleted(self):
+        self._generate('.', '../lib')
+        os.remove('a/a.h')
+        self._generate('.', '../lib')
+        eq_(_find_fragments('.compiled'), [
+            'makefiles/__parent__/lib/rules.mk',
+            'makefiles/rules.mk',
+        ])
+
+    def test_compiled_subdir_with_dot_prefix(self):
+        self._generate('.', '../lib', 'compiled_subdir: ./build\n')
+        eq_(_find_fragments('build'), [
+            'makefiles/__parent__/lib/rules.mk',
+            'makefiles/a/rules.mk',
+            'makefiles/rules.mk',
+        ])
+        with io.open('makefile', encoding='utf-8') as fin:
+            self.assertIn('include build/makefiles/a/rules.mk\n', fin.read())
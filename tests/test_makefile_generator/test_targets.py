@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=protected-access,invalid-name
+from __future__ import absolute_import, unicode_literals
+
+import logging
+
+from nose.tools import eq_
+
+from generate_cpp_makefile import (BuildTarget, _get_build_plan,
+                                   _makefile_chunks)
+
+from pignacio_scripts.testing import TestCase
+
+from .utils import get_config
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+DEPENDENCIES = {
+    'src/main.cpp': [],
+    'src/util.cpp': [],
+    'src/core.cpp': [],
+    'src/lib/extra.cpp': [],
+}
+TARGETS = [
+    {'name': 'app', 'sources': ['main.cpp'], 'link': ['util', 'core'],
+     'libs': ['pthread']},
+    {'name': 'util', 'type': 'shared_library', 'sources': ['util.cpp']},
+    {'name': 'core', 'type': 'static_library',
+     'sources': ['util.cpp', 'core.cpp']},
+]
+
+
+def _get_errors(targets):
+    try:
+        get_config(targets=targets)
+    except ValueError as error:
+        return str(error)
+    raise AssertionError('No errors for {!r}'.format(targets))
+
+
+def _get_rule(makefile, target):
+    """ The rule of ``target``, up to the next empty line. """
+    start = makefile.index('\n{}:'.format(target)) + 1
+    return makefile[start:makefile.index('\n\n', start)].split('\n')
+
+
+class TargetsConfigTest(TestCase):
+    def test_default_program(self):
+        eq_(get_config().targets,
+            [BuildTarget('prog', 'program', ['*'], [], [])])
+
+    def test_targets(self):
+        config = get_config(targets=TARGETS)
+        eq_(config.targets, [
+            BuildTarget('app', 'program', ['main.cpp'], ['pthread'],
+                        ['util', 'core']),
+            BuildTarget('util', 'shared_library', ['util.cpp'], [], []),
+            BuildTarget('core', 'static_library', ['util.cpp', 'core.cpp'],
+                        [], []),
+        ])
+
+    def test_program_or_targets_are_required(self):
+        self.assertRaisesRegexp(
+            ValueError, "Program name field 'program' is missing",
+            get_config, program='')
+
+    def test_target_without_name(self):
+        self.assertIn("Targets must be dictionaries with a 'name' field",
+                      _get_errors([{'sources': ['*']}]))
+        self.assertIn("Targets must be dictionaries with a 'name' field",
+                      _get_errors(['app']))
+
+    def test_invalid_type(self):
+        self.assertIn("Target 'app' has an invalid type 'library'",
+                      _get_errors([{'name': 'app', 'type': 'library'}]))
+
+    def test_duplicate_target(self):
+        self.assertIn("Target 'app' is defined more than once",
+                      _get_errors([{'name': 'app'}, {'name': 'app'}]))
+
+    def test_link_with_program(self):
+        self.assertIn("Target 'app' links with 'tool', which is not a "
+                      "library target",
+                      _get_errors([{'name': 'app', 'link': ['tool']},
+                                   {'name': 'tool'}]))
+
+    def test_link_with_unknown_target(self):
+        self.assertIn("Target 'app' links with 'missing'",
+                      _get_errors([{'name': 'app', 'link': ['missing']}]))
+
+    def test_string_sources(self):
+        self.assertIn("Target 'app' field 'sources' should be a list of "
+                      "strings, not 'lib/*'",
+                      _get_errors([{'name': 'app', 'sources': 'lib/*'}]))
+
+    def test_non_string_libs(self):
+        self.assertIn("Target 'app' field 'libs' should be a list of "
+                      "strings",
+                      _get_errors([{'name': 'app', 'libs': [3]}]))
+
+    def test_all_errors_are_reported(self):
+        errors = _get_errors([{'name': 'app', 'type': 'x', 'link': 'util'},
+                              {'name': 'app'}])
+        self.assertIn("invalid type 'x'", errors)
+        self.assertIn("field 'link' should be a list", errors)
+        self.assertIn("defined more than once", errors)
+
+
+class TargetsPlanTest(TestCase):
+    def setUp(self):
+        self.config = get_config(targets=TARGETS)
+        self.plan = _get_build_plan(self.config, DEPENDENCIES)
+
+    def test_target_objects(self):
+        eq_(dict(self.plan.target_objects), {
+            'app': ['.compiled/main.o'],
+            'util': ['.compiled/util.o'],
+            'core': ['.compiled/core.o', '.compiled/util.o'],
+        })
+
+    def test_unused_sources_are_not_compiled(self):
+        eq_([o for _path, o, _deps in self.plan.objects],
+            ['.compiled/core.o', '.compiled/main.o', '.compiled/util.o'])
+
+    def test_shared_library_objects_are_pic(self):
+        eq_(self.plan.pic_objects, set(['.compiled/util.o']))
+
+    def test_source_globs(self):
+        config = get_config(targets=[{'name': 'app',
+                                      'sources': ['lib/*']}])
+        plan = _get_build_plan(config, DEPENDENCIES)
+        eq_(plan.target_objects['app'], ['.compiled/lib/extra.o'])
+
+
+class TargetsMakefileTest(TestCase):
+    def setUp(self):
+        config = get_config(targets=TARGETS)
+        plan = _get_build_plan(config, DEPENDENCIES)
+        self.makefile = "".join(_makefile_chunks(config, plan, DEPENDENCIES,
+                                                 timestamp=False))
+
+    def test_objects_are_compiled_once(self):
+        eq_(self.makefile.count('\n.compiled/util.o:'), 1)
+
+    def test_pic_flag(self):
+        self.assertIn('$(CC) $(CARGS) -fPIC $(INCLUDES) -c',
+                      _get_rule(self.makefile, '.compiled/util.o')[2])
+        self.assertIn('$(CC) $(CARGS) $(INCLUDES) -c',
+                      _get_rule(self.makefile, '.compiled/core.o')[2])
+
+    def test_all_builds_every_target(self):
+        self.assertIn('\nall: app libutil.so libcore.a\n', self.makefile)
+
+    def test_program_link_rule(self):
+        rule = _get_rule(self.makefile, 'app')
+        eq_(rule[0], 'app: $(APP_OBJS) libutil.so libcore.a')
+        self.assertIn("\t$(CC) $(CARGS) -o '$@' $(APP_OBJS) libutil.so "
+                      "libcore.a $(LIBS) -lpthread", rule)
+
+    def test_shared_library_link_rule(self):
+        rule = _get_rule(self.makefile, 'libutil.so')
+        self.assertIn("\t$(CC) $(CARGS) -shared -o '$@' $(UTIL_OBJS) "
+                      "$(LIBS)", rule)
+
+    def test_static_library_rule(self):
+        rule = _get_rule(self.makefile, 'libcore.a')
+        self.assertIn("\t$(AR) rcs '$@' $(CORE_OBJS)", rule)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=protected-access,invalid-name
+from __future__ import absolute_import, unicode_literals
+
+import io
+import logging
+import os
+
+from nose.tools import eq_
+
+from generate_cpp_makefile import TIMESTAMP_PREFIX, _write_if_changed
+
+from .utils import TreeTestCase
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def _chunks(timestamp='now'):
+    return ['# Header\n', '{}{}\n'.format(TIMESTAMP_PREFIX, timestamp),
+            'all: a\n', 'a: b\n']
+
+
+class WriteIfChangedTest(TreeTestCase):
+    def setUp(self):
+        super(WriteIfChangedTest, self).setUp()
+        self.assertTrue(_write_if_changed('makefile', _chunks()))
+
+    @staticmethod
+    def _read():
+        with io.open('makefile', encoding='utf-8') as fin:
+            return fin.read()
+
+    def test_same_content_is_not_written(self):
+        self.assertFalse(_write_if_changed('makefile', _chunks()))
+
+    def test_timestamp_is_ignored(self):
+        self.assertFalse(_write_if_changed('makefile', _chunks('later')))
+        self.assertIn('now', self._read())
+
+    def test_changed_content_is_written(self):
+        self.assertTrue(_write_if_changed('makefile',
+                                          _chunks() + ['b: c\n']))
+        self.assertIn('b: c\n', self._read())
+
+    def test_edited_file_is_written(self):
+        content = self._read()
+        with io.open('makefile', 'w', encoding='utf-8') as fout:
+            fout.write(content.replace('a: b', 'a: edited'))
+        self.assertTrue(_write_if_changed('makefile', _chunks()))
+        eq_(self._read(), content)
+
+    def test_file_without_content_hash_is_written(self):
+        with io.open('makefile', 'w', encoding='utf-8') as fout:
+            fout.write(''.join(_chunks()[:-1]))
+        self.assertTrue(_write_if_changed('makefile', _chunks()))
+
+    def test_temporary_file_is_removed(self):
+        _write_if_changed('makefile', _chunks())
+        eq_(os.listdir('.'), ['makefile'])
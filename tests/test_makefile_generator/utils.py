@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import io
+import os
+import shutil
+import tempfile
+
+from generate_cpp_makefile import MakefileGeneratorConfig
+
+from pignacio_scripts.testing import TestCase
+
+
+class TreeTestCase(TestCase):
+    """ Runs each test in its own temporary directory, where ``write_tree``
+    creates the files of a source tree. """
+
+    def setUp(self):
+        cwd = os.getcwd()
+        self.root = tempfile.mkdtemp(prefix='makefile_generator_test')
+        self.addCleanup(shutil.rmtree, self.root)
+        os.chdir(self.root)
+        self.addCleanup(os.chdir, cwd)
+
+    @staticmethod
+    def write_tree(files):
+        """ Write ``files``, a map from path to content. """
+        for path, content in files.items():
+            dirname = os.path.dirname(path)
+            if dirname and not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            with io.open(path, 'w', encoding='utf-8') as fout:
+                fout.write(content)
+
+
+def get_config(**fields):
+    """ A ``MakefileGeneratorConfig`` for a ``prog`` program built from the
+    sources in ``src``, with the given ``fields`` on top. """
+    config = {'compiler': 'g++', 'source_dir': 'src', 'program': 'prog'}
+    config.update(fields)
+    return MakefileGeneratorConfig(config)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=protected-access,invalid-name
+from __future__ import absolute_import, unicode_literals
+
+import gc
+import logging
+
+from pignacio_scripts.namedtuple.class_cache import ClassCache, freeze
+from pignacio_scripts.testing import TestCase
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def _new_class():
+    class Class(object):  # pylint: disable=too-few-public-methods
+        pass
+    return Class
+
+
+class ClassCacheTest(TestCase):
+    def setUp(self):
+        self.cache = ClassCache(maxsize=2)
+
+    def test_get_missing(self):
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_get_set(self):
+        cls = _new_class()
+        self.cache.set('key', cls)
+        self.assertIs(self.cache.get('key'), cls)
+
+    def test_oldest_entry_is_evicted(self):
+        classes = [_new_class() for _ in range(3)]
+        for index, cls in enumerate(classes):
+            self.cache.set(index, cls)
+        self.assertIsNone(self.cache.get(0))
+        self.assertIs(self.cache.get(1), classes[1])
+        self.assertIs(self.cache.get(2), classes[2])
+
+    def test_get_refreshes_entry(self):
+        classes = [_new_class() for _ in range(3)]
+        self.cache.set(0, classes[0])
+        self.cache.set(1, classes[1])
+        self.cache.get(0)
+        self.cache.set(2, classes[2])
+        self.assertIs(self.cache.get(0), classes[0])
+        self.assertIsNone(self.cache.get(1))
+
+    def test_classes_are_not_kept_alive(self):
+        self.cache.set('key', _new_class())
+        gc.collect()
+        self.assertIsNone(self.cache.get('key'))
+        self.assertSize(self.cache, 0)
+
+
+class FreezeTest(TestCase):
+    def test_string_fields_are_split(self):
+        self.assertEqual(freeze('a, b c'), ('a', 'b', 'c'))
+
+    def test_lists_are_frozen(self):
+        self.assertEqual(freeze(['a', 'b']), ('a', 'b'))
+
+    def test_dicts_are_frozen_by_content(self):
+        self.assertEqual(freeze({'a': 1}), freeze({'a': 1}))
+        self.assertNotEqual(freeze({'a': 1}), freeze({'a': True}))
+
+    def test_unhashable_values_use_identity(self):
+        value = []
+        self.assertEqual(freeze({'a': value}), freeze({'a': value}))
+        self.assertNotEqual(freeze({'a': value}), freeze({'a': []}))
@@ -6,10 +6,11 @@ from __future__ import absolute_import, unicode_literals
 import collections
 import logging
 
-from nose.tools import eq_, raises
+from nose.tools import eq_, ok_, raises
 from mock import Mock, patch, sentinel
 
-from pignacio_scripts.namedtuple import mock_namedtuple, mock_namedtuple_class
+from pignacio_scripts.namedtuple import (
+    mock_namedtuple, mock_namedtuple_class, namedtuple_with_defaults)
 
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
@@ -74,3 +75,37 @@ def replace_works_on_unmocked_fields_test():
 @raises(ValueError)
 def replace_fails_on_missing_fields_test():
     MockTuple(a=1)._replace(missing=2)
+
+
+def mock_nt_class_is_cached_test():
+    ok_(mock_namedtuple_class(NamedTuple) is MockTuple)
+
+
+def mock_nt_class_is_not_shared_between_tuples_test():
+    Other = collections.namedtuple("NamedTuple", ['a', 'b', 'c'])
+    ok_(mock_namedtuple_class(Other) is not MockTuple)
+    ok_(issubclass(mock_namedtuple_class(Other), Other))
+
+
+class _NoEq(object):  # pylint: disable=too-few-public-methods
+    def __eq__(self, other):
+        raise AssertionError('__eq__ should not be called')
+
+    __hash__ = object.__hash__
+
+
+def field_access_does_not_compare_values_test():
+    value = _NoEq()
+    ok_(MockTuple(a=value).a is value)
+
+
+def private_attributes_are_accessible_test():
+    eq_(MockTuple(a=1)._fields, ('a', 'b', 'c'))
+
+
+def mocks_skip_converters_and_types_test():
+    Tuple = namedtuple_with_defaults('Tuple', ['a', 'b'],
+                                     converters={'a': int},
+                                     types={'b': int})
+    mock_tuple = mock_namedtuple(Tuple, a='1')
+    eq_(mock_tuple.a, '1')
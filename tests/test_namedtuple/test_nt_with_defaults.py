@@ -4,6 +4,7 @@
 from __future__ import absolute_import, unicode_literals
 
 import logging
+import pickle
 
 from mock import patch, sentinel
 from nose.tools import eq_, ok_
@@ -95,3 +96,96 @@ class LambdaDefaultsTest(TestCase):
         second.a.append('second')
         self.assertEqual(first.a, ['first'])
         self.assertEqual(second.a, ['second'])
+
+
+class ConvertersAndTypesTest(TestCase):
+    def setUp(self):
+        self.tuple_class = namedtuple_with_defaults(
+            'TestTuple', ['a', 'b', 'c'], defaults={'c': None},
+            converters={'a': int},
+            types={'a': int, 'c': (type(None), str)})
+
+    def test_converter_is_applied(self):
+        value = self.tuple_class('3', sentinel.b)
+        eq_(value.a, 3)
+        eq_(value.b, sentinel.b)
+
+    def test_converter_is_applied_to_kwargs(self):
+        eq_(self.tuple_class(a='4', b=sentinel.b).a, 4)
+
+    def test_valid_types(self):
+        value = self.tuple_class(1, sentinel.b, c='c')
+        eq_(value.c, 'c')
+
+    def test_invalid_type_fails(self):
+        self.assertRaisesRegexp(
+            TypeError, "Invalid type for namedtuple field 'c'",
+            self.tuple_class, 1, sentinel.b, c=3)
+
+    def test_validation_can_be_disabled(self):
+        tuple_class = namedtuple_with_defaults(
+            'TestTuple', ['a', 'b'], types={'a': int, 'b': int},
+            validate=False)
+        value = tuple_class('a', b=sentinel.b)
+        eq_(value.a, 'a')
+        eq_(value.b, sentinel.b)
+
+    def test_unknown_field_fails(self):
+        self.assertRaisesRegexp(
+            ValueError, "'d' is not a valid field",
+            namedtuple_with_defaults, 'TestTuple', ['a'], types={'d': int})
+
+    def test_unknown_field_fails_without_validation(self):
+        self.assertRaisesRegexp(
+            ValueError, "'d' is not a valid field",
+            namedtuple_with_defaults, 'TestTuple', ['a'], types={'d': int},
+            validate=False)
+
+
+class ClassCacheTest(TestCase):
+    def test_same_schema_returns_cached_class(self):
+        first = namedtuple_with_defaults('TestTuple', ['a', 'b'], {'b': 1})
+        second = namedtuple_with_defaults('TestTuple', 'a, b', {'b': 1})
+        self.assertIs(first, second)
+
+    def test_different_defaults_return_different_classes(self):
+        first = namedtuple_with_defaults('TestTuple', ['a', 'b'], {'b': 1})
+        second = namedtuple_with_defaults('TestTuple', ['a', 'b'], {'b': 2})
+        self.assertIsNot(first, second)
+        eq_(second(a=0).b, 2)
+
+    def test_default_types_are_part_of_the_key(self):
+        first = namedtuple_with_defaults('TestTuple', ['a'], {'a': 1})
+        second = namedtuple_with_defaults('TestTuple', ['a'], {'a': True})
+        self.assertIsNot(first, second)
+        self.assertIs(second().a, True)
+
+    def test_mutable_defaults_are_keyed_by_identity(self):
+        first = namedtuple_with_defaults('TestTuple', ['a'], {'a': []})
+        second = namedtuple_with_defaults('TestTuple', ['a'], {'a': []})
+        self.assertIsNot(first, second)
+
+    def test_changes_to_the_defaults_dict_are_not_seen(self):
+        defaults = {'b': 1}
+        first = namedtuple_with_defaults('TestTuple', ['a', 'b'], defaults)
+        defaults['b'] = 2
+        eq_(first(a=0).b, 1)
+        second = namedtuple_with_defaults('TestTuple', ['a', 'b'], {'b': 1})
+        self.assertIs(first, second)
+        eq_(second(a=0).b, 1)
+
+    def test_validate_is_part_of_the_key(self):
+        first = namedtuple_with_defaults('TestTuple', ['a'],
+                                         types={'a': int})
+        second = namedtuple_with_defaults('TestTuple', ['a'],
+                                          types={'a': int}, validate=False)
+        self.assertIsNot(first, second)
+
+
+PickledTuple = namedtuple_with_defaults('PickledTuple', 'a b', {'b': 2})
+
+
+class PickleTest(TestCase):
+    def test_pickle(self):
+        value = PickledTuple(1)
+        self.assertEqual(pickle.loads(pickle.dumps(value)), value)
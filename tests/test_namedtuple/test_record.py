@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=protected-access,invalid-name
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import pickle
+import sys
+
+from mock import sentinel
+from nose.tools import eq_
+
+from pignacio_scripts.namedtuple import record_with_defaults
+from pignacio_scripts.testing import TestCase
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+PickledRecord = record_with_defaults('PickledRecord', 'a b', {'b': 2})
+
+
+class RecordWithDefaultsTest(TestCase):
+    def setUp(self):
+        self.record_class = record_with_defaults(
+            'TestRecord', ['a', 'b', 'c'],
+            defaults=dict(b=sentinel.b_default))
+
+    def test_full_args(self):
+        value = self.record_class(sentinel.a, sentinel.b, sentinel.c)
+        eq_(value.a, sentinel.a)
+        eq_(value.b, sentinel.b)
+        eq_(value.c, sentinel.c)
+
+    def test_full_kwargs(self):
+        value = self.record_class(a=sentinel.a, b=sentinel.b, c=sentinel.c)
+        eq_(value.a, sentinel.a)
+        eq_(value.b, sentinel.b)
+        eq_(value.c, sentinel.c)
+
+    def test_default_is_set(self):
+        value = self.record_class(sentinel.a, c=sentinel.c)
+        eq_(value.b, sentinel.b_default)
+
+    def test_missing_arg_fails(self):
+        self.assertRaisesRegexp(ValueError, 'Missing argument for record',
+                                self.record_class, sentinel.a, sentinel.b)
+
+    def test_extra_kwargs_fails(self):
+        self.assertRaisesRegexp(
+            ValueError, 'Unexpected argument for record',
+            self.record_class,
+            a=sentinel.a, b=sentinel.b, c=sentinel.c, d=sentinel.d)
+
+    def test_extra_args_fails(self):
+        self.assertRaisesRegexp(
+            ValueError, 'Too many arguments for record',
+            self.record_class,
+            sentinel.a, sentinel.b, sentinel.c, sentinel.d)
+
+    def test_extra_args_fails_with_builtin_field_names(self):
+        record_class = record_with_defaults('Record', ['start', 'len'])
+        self.assertRaisesRegexp(
+            ValueError, 'Too many arguments for record',
+            record_class, 1, 2, 3)
+
+    def test_fields_can_be_set(self):
+        value = self.record_class(sentinel.a, c=sentinel.c)
+        value.a = sentinel.new_a
+        eq_(value.a, sentinel.new_a)
+
+    def test_new_attributes_cannot_be_set(self):
+        value = self.record_class(sentinel.a, c=sentinel.c)
+        with self.assertRaises(AttributeError):
+            value.d = sentinel.d
+
+    def test_replace(self):
+        value = self.record_class(sentinel.a, c=sentinel.c)
+        new_value = value._replace(a=sentinel.new_a)
+        eq_(new_value.a, sentinel.new_a)
+        eq_(new_value.b, sentinel.b_default)
+        eq_(value.a, sentinel.a)
+
+    def test_replace_fails_on_missing_fields(self):
+        value = self.record_class(sentinel.a, c=sentinel.c)
+        self.assertRaisesRegexp(ValueError, 'Unexpected argument for record',
+                                value._replace, d=sentinel.d)
+
+    def test_asdict(self):
+        value = self.record_class(sentinel.a, c=sentinel.c)
+        eq_(list(value._asdict().items()), [('a', sentinel.a),
+                                            ('b', sentinel.b_default),
+                                            ('c', sentinel.c)])
+
+    def test_equality(self):
+        value = self.record_class(1, 2, 3)
+        self.assertEqual(value, self.record_class(1, 2, 3))
+        self.assertNotEqual(value, self.record_class(1, 2, 4))
+        self.assertNotEqual(value, (1, 2, 3))
+
+    def test_mutable_records_are_not_hashable(self):
+        with self.assertRaises(TypeError):
+            hash(self.record_class(1, 2, 3))
+
+    def test_repr(self):
+        eq_(repr(self.record_class(1, 2, 3)), 'TestRecord(a=1, b=2, c=3)')
+
+    def test_has_no_dict(self):
+        self.assertFalse(hasattr(self.record_class(1, 2, 3), '__dict__'))
+
+    def test_size_is_similar_to_tuple(self):
+        self.assertLessEqual(sys.getsizeof(self.record_class(1, 2, 3)),
+                             sys.getsizeof((1, 2, 3)))
+
+    def test_pickle(self):
+        value = PickledRecord(1)
+        self.assertEqual(pickle.loads(pickle.dumps(value)), value)
+
+
+class FrozenRecordTest(TestCase):
+    def setUp(self):
+        self.record_class = record_with_defaults('TestRecord', 'a,b',
+                                                 frozen=True)
+
+    def test_fields_cannot_be_set(self):
+        value = self.record_class(1, 2)
+        self.assertRaisesRegexp(AttributeError, "Cannot set 'a'",
+                                setattr, value, 'a', 3)
+
+    def test_fields_cannot_be_deleted(self):
+        value = self.record_class(1, 2)
+        self.assertRaisesRegexp(AttributeError, "Cannot delete 'a'",
+                                delattr, value, 'a')
+
+    def test_hash(self):
+        self.assertEqual(hash(self.record_class(1, 2)),
+                         hash(self.record_class(1, 2)))
+
+    def test_replace(self):
+        eq_(self.record_class(1, 2)._replace(b=3).b, 3)
+
+
+class LambdaDefaultsTest(TestCase):
+    def test_mutable_defaults_work(self):
+        TestRecord = record_with_defaults(
+            'TestRecord', 'a', defaults=lambda: {
+                'a': [],
+            })
+
+        first = TestRecord()
+        first.a.append('first')
+        second = TestRecord()
+        second.a.append('second')
+        self.assertEqual(first.a, ['first'])
+        self.assertEqual(second.a, ['second'])
+
+
+class FieldValidationTest(TestCase):
+    def test_invalid_field_name(self):
+        self.assertRaisesRegexp(ValueError, 'not a valid field name',
+                                record_with_defaults, 'Record', ['_a'])
+
+    def test_keyword_field_name(self):
+        self.assertRaisesRegexp(ValueError, 'not a valid field name',
+                                record_with_defaults, 'Record', ['class'])
+
+    def test_duplicate_field_name(self):
+        self.assertRaisesRegexp(ValueError, 'Duplicate field name',
+                                record_with_defaults, 'Record', 'a a')
+
+    def test_invalid_record_name(self):
+        self.assertRaisesRegexp(ValueError, 'not a valid record name',
+                                record_with_defaults, 'a-record', 'a')
+
+
+class ClassCacheTest(TestCase):
+    def test_same_schema_returns_cached_class(self):
+        first = record_with_defaults('Record', ['a', 'b'], {'b': 1})
+        second = record_with_defaults('Record', 'a b', {'b': 1})
+        self.assertIs(first, second)
+
+    def test_changes_to_the_defaults_dict_are_not_seen(self):
+        defaults = {'b': 1}
+        first = record_with_defaults('Record', ['a', 'b'], defaults)
+        defaults['b'] = 2
+        eq_(first(a=0).b, 1)
+        second = record_with_defaults('Record', ['a', 'b'], {'b': 1})
+        self.assertIs(first, second)
+        eq_(second(a=0).b, 1)